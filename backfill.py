@@ -1,179 +1,330 @@
 """
 Backfill: pobiera WSZYSTKIE deale z pipeline SDR i generuje JSONy per dzien
 z kumulatywnymi konwersjami (snapshot na dany dzien).
-Użycie: python backfill.py
+Użycie: python backfill.py [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--workers N] [--fresh]
+
+Pobieranie deali zapisuje checkpoint (cache/backfill_checkpoint.jsonl) po
+każdej stronie wyników - przerwany backfill wznawia od ostatniej strony.
+Checkpoint jest usuwany po udanym backfillu; --fresh zaczyna od zera.
+Checkpoint starszy niż BACKFILL_CHECKPOINT_MAX_AGE_HOURS (domyślnie 24 h)
+jest odrzucany - wznowienie łączyłoby strony sprzed wielu zmian w HubSpot.
+
+--workers N dzieli daty na shardy i generuje je w N procesach. Deale są
+przygotowane raz w procesie głównym i dziedziczone przez fork (copy-on-write),
+bez pickle'owania ich do każdego zadania; index.json aktualizowany jest raz.
 """
+import gc
 import os
 import sys
-import json
-import time
-from datetime import datetime, timedelta
+import asyncio
+import argparse
+import multiprocessing
+from datetime import date, timedelta
 from collections import defaultdict
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from generate_data import (
-    headers, SDR_PIPELINE_ID, PROPERTIES, STAGES, DATE_ENTERED_FIELDS,
-    EXCLUDE_OWNERS, is_date_match, calc_stats, calc_conversions,
-    build_json, update_index, get_owners
+    NEW_LEAD, MQL, SQL, iter_pipeline_deals, pipeline_search_payload, get_report_date,
+    normalize_deal, fetch_lost_descriptions, to_day, day_str, conv_metrics_from_counts,
+    conversion_windows, build_json, payload_from_history,
 )
-import requests
-
-
-def api_request(method, url, **kwargs):
-    """Wrapper z retry na 429 rate limit i timeout."""
-    kwargs.setdefault("timeout", 60)
-    for attempt in range(8):
-        try:
-            r = method(url, **kwargs)
-        except requests.exceptions.ReadTimeout:
-            print(f"    Timeout - czekam 10s (próba {attempt+1}/8)...")
-            time.sleep(10)
-            continue
-        except requests.exceptions.ConnectionError:
-            print(f"    Connection error - czekam 15s (próba {attempt+1}/8)...")
-            time.sleep(15)
-            continue
-        if r.status_code == 429:
-            wait = max(int(r.headers.get("Retry-After", 30)), 30)
-            print(f"    Rate limit - czekam {wait}s (próba {attempt+1}/8)...")
-            time.sleep(wait)
-            continue
-        return r
-    return r
-
-
-def fetch_all_pipeline_deals():
-    """Pobiera WSZYSTKIE deale z pipeline SDR (bez filtra po dacie)."""
-    all_deals = []
-    after = None
-
-    while True:
-        payload = {
-            "filterGroups": [{
-                "filters": [
-                    {"propertyName": "pipeline", "operator": "EQ", "value": SDR_PIPELINE_ID},
-                ]
-            }],
-            "properties": PROPERTIES,
-            "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "DESCENDING"}],
-            "limit": 100
-        }
-        if after:
-            payload["after"] = after
-
-        r = api_request(requests.post,
-            "https://api.hubapi.com/crm/v3/objects/deals/search",
-            headers=headers, json=payload, timeout=30
-        )
-        if r.status_code != 200:
-            print(f"API error: {r.status_code}")
-            break
-        time.sleep(0.5)
-
-        data = r.json()
-        results = data.get("results", [])
-        all_deals.extend(results)
-        print(f"  Pobrano {len(all_deals)} deali...", end='\r')
-
-        after = data.get("paging", {}).get("next", {}).get("after")
-        if not after:
-            break
-
-    print(f"  Pobrano {len(all_deals)} deali łącznie     ")
-    return all_deals
-
-
-def extract_deal_dates(deal):
-    """Zwraca set dat (YYYY-MM-DD) w których deal zmienił etap."""
-    props = deal["properties"]
-    dates = set()
-    for field in DATE_ENTERED_FIELDS:
-        val = props.get(field)
-        if val:
-            try:
-                dt = datetime.fromisoformat(val.replace("Z", "+00:00"))
-                dates.add(dt.strftime("%Y-%m-%d"))
-            except:
-                pass
-    return dates
-
-
-def process_deals_for_date(all_deals, owners, report_date):
-    """Filtruje deale które mialy zmiane etapu w danym dniu."""
-    today_deals = []
-    for deal in all_deals:
-        props = deal["properties"]
-        owner_name = owners.get(props.get("hubspot_owner_id"), "Nieznany")
-        if owner_name in EXCLUDE_OWNERS:
-            continue
-
-        stage_changes = {}
-        for field, stage_name in DATE_ENTERED_FIELDS.items():
-            if is_date_match(props.get(field), report_date):
-                stage_changes[stage_name] = props.get(field)
-
-        if stage_changes:
-            today_deals.append({
-                "name": props.get("dealname", "?"),
-                "current_stage": STAGES.get(props.get("dealstage"), props.get("dealstage")),
-                "owner_name": owner_name,
-                "stage_changes": stage_changes,
-                "lost_reason": props.get("lost_reason") or props.get("closed_lost_reason") or "",
-                "lost_description": props.get("lost_description") or "",
-            })
-    return today_deals
+from conversion_index import ConversionIndex
+import owners_cache
+from fetch_checkpoint import DEFAULT_MAX_AGE, SearchCheckpoint, query_fingerprint
+from history_store import HistoryStore
+from output_writer import OutputBatch, update_index
+from rollups import write_rollups
+from hubspot_client import HubSpotClient
+
+
+def default_checkpoint_path():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv("BACKFILL_CHECKPOINT") or os.path.join(script_dir, "cache", "backfill_checkpoint.jsonl")
+
+
+def checkpoint_max_age():
+    hours = os.getenv("BACKFILL_CHECKPOINT_MAX_AGE_HOURS")
+    return timedelta(hours=float(hours)) if hours else DEFAULT_MAX_AGE
+
+
+async def ingest_pipeline_deals(checkpoint=None):
+    """Strumieniowo pobiera WSZYSTKIE deale z pipeline SDR i od razu je indeksuje.
+
+    Każda strona surowych deali jest normalizowana, dodawana do DealIndex
+    i porzucana, podczas gdy kolejne strony są w drodze. Deale ownerów
+    spoza cache czekają na odświeżenie cache ownerów na końcu.
+    Zwraca (owners, DealIndex, liczba pobranych deali).
+    """
+    index = DealIndex()
+    deferred = []
+    fetched = 0
+    async with HubSpotClient() as client:
+        owners = await owners_cache.get_owners(client)
+        async for page in iter_pipeline_deals(client, checkpoint=checkpoint):
+            fetched += len(page)
+            for raw in page:
+                owner_id = raw["properties"].get("hubspot_owner_id")
+                if owner_id and owner_id not in owners:
+                    deferred.append(raw)
+                    continue
+                deal = normalize_deal(raw, owners)
+                if deal is not None:
+                    index.add(deal)
+
+        if deferred:
+            owners = await owners_cache.get_owners(client, owners_cache.owner_ids(deferred))
+            for raw in deferred:
+                deal = normalize_deal(raw, owners)
+                if deal is not None:
+                    index.add(deal)
+    return owners, index, fetched
+
+
+# Liczniki konwersji: total_leads, total_mql, lead_to_mql, mql_to_sql, lead_to_sql
+CONV_LEADS, CONV_MQL, CONV_LEAD_MQL, CONV_MQL_SQL, CONV_LEAD_SQL = range(5)
+
+
+class DealIndex:
+    """Akumulator zdarzeń deali (Deal) zasilany deal po dealu, np. prosto ze strumienia stron.
+
+    finish() zwraca (activity, conv_events, active_dates):
+      activity     - {dzień: [Deal]} posortowane po id deala,
+      conv_events  - [(dzień efektywny, rok New Lead, owner, licznik)],
+      active_dates - set dat (YYYY-MM-DD) ze zmianą etapu.
+    """
+
+    def __init__(self):
+        self.activity = defaultdict(list)
+        self.conv_events = []
+        self.conv_entries = []
+        self.deal_count = 0
+
+    def add(self, deal):
+        self.deal_count += 1
+        for day in set(deal.entered):
+            if day:
+                self.activity[day].append(deal)
+
+        # Deal liczy się do konwersji roku New Lead od dnia wejścia w New Lead;
+        # kolejne etapy liczą się od dnia, w którym oba warunki są spełnione.
+        nl = deal.entered[NEW_LEAD]
+        if not nl:
+            return
+        mql = deal.entered[MQL]
+        sql = deal.entered[SQL]
+        owner_name = deal.owner_name
+        self.conv_entries.append((owner_name, nl, mql, sql))
+        year = date.fromordinal(nl).year
+        conv_events = self.conv_events
+        conv_events.append((nl, year, owner_name, CONV_LEADS))
+        if mql:
+            conv_events.append((max(nl, mql), year, owner_name, CONV_MQL))
+            conv_events.append((max(nl, mql), year, owner_name, CONV_LEAD_MQL))
+        if sql:
+            conv_events.append((max(nl, sql), year, owner_name, CONV_LEAD_SQL))
+        if mql and sql:
+            conv_events.append((max(nl, mql, sql), year, owner_name, CONV_MQL_SQL))
+
+    def finish(self):
+        # Strony przychodzą w kolejności nadejścia - porządek deali jak w pełnym pobraniu (po id)
+        for deals in self.activity.values():
+            deals.sort(key=lambda d: int(d.id))
+        self.conv_events.sort(key=lambda e: e[0])
+        active_dates = {day_str(day) for day in self.activity}
+        return self.activity, self.conv_events, active_dates
+
+    def conversion_index(self):
+        """ConversionIndex (okna 30d/QTD) z tych samych deali."""
+        return ConversionIndex(self.conv_entries)
+
+
+def index_deals(deals):
+    """Jedno przejście po dealach (Deal): grupuje zdarzenia po dniu (patrz DealIndex)."""
+    index = DealIndex()
+    for deal in deals:
+        index.add(deal)
+    return index.finish()
+
+
+def conversions_snapshot(year_counters):
+    """Zamienia liczniki {owner: [5 liczników]} na (overall, sdr_conv) jak calc_conversions()."""
+    totals = [0] * 5
+    sdr_conv = {}
+    for owner, counts in year_counters.items():
+        for i, c in enumerate(counts):
+            totals[i] += c
+        sdr_conv[owner] = conv_metrics_from_counts(*counts)
+    return conv_metrics_from_counts(*totals), sdr_conv
+
+
+def generate_days(dates, activity, conv_events, conv_index=None):
+    """Generuje payloady build_json dla posortowanych dat w jednym przebiegu.
+
+    activity, conv_events: wynik index_deals(). Konwersje YTD liczone są
+    licznikami narastającymi zamiast pełnego przeliczenia calc_conversions()
+    dla każdego dnia. conv_index (ConversionIndex) dokłada okna 30d/QTD.
+    Zwraca generator (data, deale dnia, payload).
+    """
+    counters = defaultdict(lambda: defaultdict(lambda: [0] * 5))
+    pos = 0
+
+    for date_str in dates:
+        day = to_day(date_str)
+        while pos < len(conv_events) and conv_events[pos][0] <= day:
+            _, year, owner_name, metric = conv_events[pos]
+            counters[year][owner_name][metric] += 1
+            pos += 1
+
+        today_deals = activity.get(day, [])
+        conversions, sdr_conversions = conversions_snapshot(counters[int(date_str[:4])])
+        windows, sdr_windows = conversion_windows(conv_index, date_str) if conv_index else (None, None)
+        yield date_str, today_deals, build_json(
+            today_deals, date_str, conversions, sdr_conversions, windows, sdr_windows)
+
+
+# Dane współdzielone z workerami przez fork (ustawiane przed utworzeniem puli)
+_shared = {}
+
+
+def backfill_shard(dates):
+    """Worker: generuje i zapisuje dni jednego shardu (posortowane, kolejne daty).
+
+    Zwraca (wiersze [(data, liczba deali, Lead->MQL, zapisany)], odciski zapisanych dni).
+    index.json aktualizuje proces główny.
+    """
+    output = OutputBatch(_shared["data_dir"])
+    rows = []
+    for date_str, today_deals, data in generate_days(
+            dates, _shared["activity"], _shared["conv_events"], _shared["conv_index"]):
+        written = output.add(date_str, data)
+        rows.append((date_str, len(today_deals), data["conversions"].get("lead_mql", "-"), written))
+    output.flush()
+    return rows, output.fingerprints
+
+
+def split_dates(dates, parts):
+    """Dzieli posortowane daty na co najwyżej `parts` kolejnych shardów."""
+    size = -(-len(dates) // parts) if dates else 1
+    return [dates[i:i + size] for i in range(0, len(dates), size)]
+
+
+def generate_parallel(dates, workers, data_dir, activity, conv_events, conv_index):
+    """Generuje dni w puli procesów (fork). Zwraca (zapisane daty, liczba pominiętych)."""
+    _shared.update(data_dir=data_dir, activity=activity, conv_events=conv_events, conv_index=conv_index)
+    # Obiekty sprzed forka poza GC - workery nie dotykają ich stron pamięci
+    gc.freeze()
+    written_dates, fingerprints, skipped = [], {}, 0
+    try:
+        # Więcej shardów niż workerów - równiejsze obciążenie przy nierównych dniach
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for rows, shard_fingerprints in pool.imap(backfill_shard, split_dates(dates, workers * 4)):
+                for date_str, deal_count, conv_str, written in rows:
+                    print(f"   {date_str}: {deal_count} deali | Lead->MQL: {conv_str}"
+                          + ("" if written else " (bez zmian)"))
+                    if written:
+                        written_dates.append(date_str)
+                    else:
+                        skipped += 1
+                fingerprints.update(shard_fingerprints)
+    finally:
+        gc.unfreeze()
+        _shared.clear()
+
+    if written_dates:
+        update_index(data_dir, *written_dates, fingerprints=fingerprints)
+    return written_dates, skipped
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Backfill JSON-ów dashboardu SDR")
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat,
+                        help="pierwszy dzień (YYYY-MM-DD, domyślnie 1 stycznia roku --to)")
+    parser.add_argument("--to", dest="to_date", type=date.fromisoformat,
+                        help="ostatni dzień (YYYY-MM-DD, domyślnie wczoraj / REPORT_DATE)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="liczba procesów generujących dni (domyślnie 1)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignoruj checkpoint poprzedniego, przerwanego pobierania")
+    args = parser.parse_args()
+
+    end_date = args.to_date or date.fromisoformat(get_report_date())
+    start_date = args.from_date or end_date.replace(month=1, day=1)
+    if start_date > end_date:
+        parser.error("--from jest późniejsze niż --to")
+
+    workers = max(1, args.workers)
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("Uwaga: brak fork na tej platformie - backfill w jednym procesie")
+        workers = 1
+    if workers > 1 and os.getenv("HISTORY_DB"):
+        print("Uwaga: HISTORY_DB wymaga zapisu z jednego procesu - backfill w jednym procesie")
+        workers = 1
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(script_dir, "data")
     os.makedirs(data_dir, exist_ok=True)
 
-    start_date = datetime(2026, 2, 1)
-    end_date = datetime(2026, 2, 19)
-
-    print("=== SDR Dashboard Backfill ===\n")
+    print("=== SDR Dashboard Backfill ===")
+    print(f"Zakres: {start_date} - {end_date}\n")
 
-    print("1. Pobieram ownerów...")
-    owners = get_owners()
-    print(f"   Znaleziono {len(owners)} ownerów\n")
+    checkpoint_path = default_checkpoint_path()
+    if args.fresh and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = SearchCheckpoint(checkpoint_path, query_fingerprint("deals", pipeline_search_payload()),
+                                  max_age=checkpoint_max_age())
 
-    print("2. Pobieram WSZYSTKIE deale z pipeline SDR...")
-    all_deals = fetch_all_pipeline_deals()
-    print()
+    print("1-3. Pobieram i indeksuję WSZYSTKIE deale z pipeline SDR (strumieniowo)...")
+    try:
+        owners, deal_index, fetched = asyncio.run(ingest_pipeline_deals(checkpoint))
+    finally:
+        checkpoint.close()
+    print(f"   Znaleziono {len(owners)} ownerów, {fetched} deali ({deal_index.deal_count} po wykluczeniach)\n")
 
-    # Znajdz wszystkie daty w których byly zmiany
-    print("3. Analizuję daty zmian etapów...")
-    all_active_dates = set()
-    for deal in all_deals:
-        all_active_dates.update(extract_deal_dates(deal))
+    activity, conv_events, all_active_dates = deal_index.finish()
+    conv_index = deal_index.conversion_index()
+    del deal_index
 
-    dates_in_range = sorted([d for d in all_active_dates
-                             if start_date.strftime("%Y-%m-%d") <= d <= end_date.strftime("%Y-%m-%d")])
+    dates_in_range = sorted(d for d in all_active_dates if start_date.isoformat() <= d <= end_date.isoformat())
     print(f"   Znaleziono {len(dates_in_range)} dni z aktywnością\n")
 
-    print("4. Generuję JSONy per dzień (z kumulatywnymi konwersjami)...")
-    generated = 0
+    # Opisy powodów utraty tylko dla deali straconych w generowanych dniach
+    lost = {}
     for date_str in dates_in_range:
-        today_deals = process_deals_for_date(all_deals, owners, date_str)
-
-        # Konwersje z tego roku (snapshot na dany dzień)
-        year_start = date_str[:4] + "-01-01"
-        conversions, sdr_conversions = calc_conversions(all_deals, owners, as_of_date=date_str, from_date=year_start)
-
-        data = build_json(today_deals, date_str, conversions, sdr_conversions)
+        day = to_day(date_str)
+        lost.update((d.id, d) for d in activity.get(day, []) if d.is_lost_on(day))
+    asyncio.run(fetch_lost_descriptions(list(lost.values())))
+    print(f"   Opisy utraty: {len(lost)} deali\n")
 
-        json_path = os.path.join(data_dir, f"{date_str}.json")
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        update_index(data_dir, date_str)
-        conv_str = conversions.get("lead_mql", "-")
-        print(f"   {date_str}: {len(today_deals)} deali | Lead->MQL: {conv_str}")
-        generated += 1
-
-    print(f"\nGotowe! Wygenerowano {generated} plików JSON.")
+    print("4. Generuję JSONy per dzień (z kumulatywnymi konwersjami)...")
+    if workers > 1:
+        print(f"   Procesów: {workers}")
+        written_dates, skipped = generate_parallel(
+            dates_in_range, workers, data_dir, activity, conv_events, conv_index)
+    else:
+        history = HistoryStore(os.getenv("HISTORY_DB")) if os.getenv("HISTORY_DB") else None
+        with OutputBatch(data_dir) as output:
+            for date_str, today_deals, data in generate_days(dates_in_range, activity, conv_events, conv_index):
+                conversions = data["conversions"]
+                if history:
+                    history.record_day(data, today_deals)
+                    data = payload_from_history(history, date_str)
+
+                written = output.add(date_str, data)
+                conv_str = conversions.get("lead_mql", "-")
+                print(f"   {date_str}: {len(today_deals)} deali | Lead->MQL: {conv_str}"
+                      + ("" if written else " (bez zmian)"))
+
+        if history:
+            history.commit()
+            history.close()
+        written_dates, skipped = output.dates, len(output.skipped)
+
+    print("\n5. Generuję zestawienia tygodniowe i miesięczne...")
+    write_rollups(data_dir, written_dates)
+
+    checkpoint.remove()
+    print(f"\nGotowe! Zapisano {len(written_dates)} plików JSON ({skipped} bez zmian).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+"""
+Benchmarki etapów pipeline'u na syntetycznych danych (replay_server.SyntheticPipeline).
+
+Mierzy czas, przyrost RSS i alokacje (tracemalloc) dla każdego etapu,
+dla kolejnych rozmiarów pipeline'u i długości zakresu dat. Wyniki zapisuje
+jako JSON, żeby dało się porównać je między commitami.
+
+Użycie:
+  python bench.py --sizes 1000,10000,100000 --days 30,365
+  python bench.py --sizes 10000 --fetch --compare bench_results/<poprzedni>.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import (
+    normalize_deals, process_deals, calc_conversions, build_json,
+    fetch_all_pipeline_deals, to_day, numpy_backend, build_deal_arrays, arrays_day_stats,
+    indexed_conversions,
+)
+from output_writer import update_index, dumps, COMPRESSORS
+from backfill import index_deals, generate_days
+from hubspot_client import HubSpotClient
+from replay_server import SyntheticPipeline, create_synthetic_app
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+END_DATE = date(2026, 4, 30)
+
+
+def current_rss_mb():
+    """Bieżące RSS procesu z /proc/self/statm (Linux); None, gdy niedostępne."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def measure(fn, memory=True):
+    """Uruchamia fn() i zwraca (wynik, metryki). Alokacje mierzone w osobnym przebiegu.
+
+    rss_delta_mb to przyrost RSS procesu w trakcie etapu (po - przed),
+    nie szczyt: ru_maxrss jest rekordem całego procesu, więc nie nadaje się
+    do pomiaru pojedynczego etapu. Szczyt alokacji etapu to peak_alloc_mb.
+    """
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    result = fn()
+    metrics = {"wall_s": round(time.perf_counter() - start, 4)}
+    rss_after = current_rss_mb()
+    if rss_before is not None and rss_after is not None:
+        metrics["rss_delta_mb"] = round(rss_after - rss_before, 1)
+
+    if memory:
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics["peak_alloc_mb"] = round(peak / (1024 * 1024), 2)
+        metrics["net_alloc_blocks"] = sys.getallocatedblocks() - blocks_before
+    return result, metrics
+
+
+async def fetch_from_stand_in(pipeline):
+    """Pobiera wszystkie deale z lokalnego serwera zastępczego przez HubSpotClient."""
+    runner = web.AppRunner(create_synthetic_app(pipeline))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with HubSpotClient(token="bench", base_url=f"http://127.0.0.1:{port}",
+                                 rate_per_second=10000, search_rate_per_second=10000) as client:
+            owners, deals = await asyncio.gather(client.get_owners(), fetch_all_pipeline_deals(client))
+        return owners, deals, client.requests_made
+    finally:
+        await runner.cleanup()
+
+
+def run_case(size, days, fetch=False, memory=True):
+    """Benchmark wszystkich etapów dla pipeline'u size deali rozłożonych na days dni."""
+    start = END_DATE - timedelta(days=days - 1)
+    report_date = END_DATE.isoformat()
+    pipeline = SyntheticPipeline(size, start=start.isoformat(), days=days)
+    owners = {oid: f"{f} {l}" for oid, (f, l) in pipeline.owners.items()}
+    raw_deals = list(pipeline.deals())
+    results = []
+
+    def record(stage, metrics, **extra):
+        row = {"size": size, "days": days, "stage": stage, **metrics, **extra}
+        results.append(row)
+        print(f"  {size:>7} deali | {days:>4} dni | {stage:<16} {metrics['wall_s']:>9.3f}s"
+              + (f" | ΔRSS {metrics['rss_delta_mb']:>+7.1f} MB" if "rss_delta_mb" in metrics else "")
+              + (f" | alloc {metrics['peak_alloc_mb']:>7.1f} MB" if "peak_alloc_mb" in metrics else ""))
+
+    if fetch:
+        (_, fetched, api_calls), metrics = measure(lambda: asyncio.run(fetch_from_stand_in(pipeline)), memory=False)
+        record("fetch", metrics, api_calls=api_calls, deals=len(fetched))
+        del fetched
+
+    deals, metrics = measure(lambda: normalize_deals(raw_deals, owners), memory)
+    record("normalize", metrics)
+
+    today_deals, metrics = measure(lambda: process_deals(deals, report_date), memory)
+    record("process_deals", metrics, today_deals=len(today_deals))
+
+    (conversions, sdr_conversions), metrics = measure(
+        lambda: calc_conversions(deals, as_of_date=report_date, from_date=report_date[:4] + "-01-01"), memory)
+    record("calc_conversions", metrics)
+
+    payload, metrics = measure(lambda: build_json(today_deals, report_date, conversions, sdr_conversions), memory)
+    record("build_json", metrics)
+
+    if numpy_backend is not None:
+        arrays, metrics = measure(lambda: build_deal_arrays(deals), memory)
+        record("numpy_arrays", metrics)
+
+        def numpy_day():
+            day = to_day(report_date)
+            active = [deals[i] for i in arrays.active(day)]
+            return active, arrays_day_stats(arrays, day), indexed_conversions(arrays, report_date, report_date[:4] + "-01-01")
+
+        _, metrics = measure(numpy_day, memory)
+        record("numpy_day", metrics)
+
+    serialized, metrics = measure(lambda: dumps(payload), memory)
+    record("serialize", metrics, bytes=len(serialized))
+
+    compressed, metrics = measure(lambda: COMPRESSORS["gzip"][1](serialized), memory)
+    record("gzip", metrics, bytes=len(compressed))
+
+    def backfill():
+        activity, conv_events, active_dates = index_deals(deals)
+        dates = sorted(d for d in active_dates if start.isoformat() <= d <= report_date)
+        return [p for _, _, p in generate_days(dates, activity, conv_events)]
+
+    payloads, metrics = measure(backfill, memory)
+    record("backfill", metrics, dates=len(payloads))
+
+    dates = [p["date"] for p in payloads]
+
+    def write_index():
+        with tempfile.TemporaryDirectory() as data_dir:
+            update_index(data_dir, *dates)
+
+    _, metrics = measure(quiet(write_index), memory=False)
+    record("update_index", metrics, dates=len(dates))
+
+    return results
+
+
+def quiet(fn):
+    """Wycisza printy funkcji (update_index drukuje postęp)."""
+    def wrapper():
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                return fn()
+            finally:
+                sys.stdout = stdout
+    return wrapper
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["size"], r["days"], r["stage"]): r for r in baseline["results"]}
+    print(f"\nPorównanie z {baseline_path} ({baseline.get('git')}):")
+    for r in results:
+        old = previous.get((r["size"], r["days"], r["stage"]))
+        if not old or not old["wall_s"]:
+            continue
+        ratio = r["wall_s"] / old["wall_s"]
+        flag = "  <-- wolniej" if ratio > 1.2 else ""
+        print(f"  {r['size']:>7} | {r['days']:>4} | {r['stage']:<16} {old['wall_s']:>9.3f}s -> {r['wall_s']:>9.3f}s (x{ratio:.2f}){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarki etapów SDR dashboard")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="liczby deali, po przecinku")
+    parser.add_argument("--days", default="90", help="długości zakresu dat, po przecinku")
+    parser.add_argument("--fetch", action="store_true", help="mierz też pobieranie z lokalnego serwera zastępczego")
+    parser.add_argument("--no-memory", action="store_true", help="bez pomiaru alokacji (tracemalloc)")
+    parser.add_argument("--output", help="ścieżka pliku z wynikami (domyślnie bench_results/<git>.json)")
+    parser.add_argument("--compare", help="plik z poprzednimi wynikami do porównania")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    day_ranges = [int(d) for d in args.days.split(",")]
+
+    results = []
+    for days in day_ranges:
+        for size in sizes:
+            results.extend(run_case(size, days, fetch=args.fetch, memory=not args.no_memory))
+
+    revision = git_revision()
+    report = {
+        "git": revision,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nWyniki zapisane: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
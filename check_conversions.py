@@ -0,0 +1,103 @@
+"""
+Randomizowany test zgodności indeksów konwersji z calc_conversions.
+
+ConversionIndex (drzewo Fenwicka, dzień kwalifikacji = max(nl, mql, sql))
+i DealArrays (backend NumPy) muszą dawać dla każdego okna [from, as_of]
+dokładnie to samo co liniowy calc_conversions. Skrypt sprawdza to na
+syntetycznym pipeline (replay_server.SyntheticPipeline) uzupełnionym
+o deale z losowymi, także nieuporządkowanymi dniami etapów (MQL przed
+New Lead, SQL bez MQL, brakujące etapy), dla losowych okien oraz okien
+YTD / 30 dni / QTD. Kod wyjścia 1 przy pierwszej niezgodności.
+
+Użycie:
+  python check_conversions.py
+  python check_conversions.py --sizes 2000,20000 --windows 300 --seed 7
+"""
+import os
+import sys
+import random
+import argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import (
+    Deal, STAGE_ORDER, NEW_LEAD, MQL, SQL, WON, normalize_deals, calc_conversions,
+    build_conversion_index, indexed_conversions, numpy_backend, build_deal_arrays, day_str,
+)
+from replay_server import SyntheticPipeline
+
+END_DATE = date(2026, 4, 30)
+
+
+def random_deals(rnd, count, first_day, last_day, owners):
+    """Deale z losowymi dniami New Lead / MQL / SQL / Won, bez gwarancji kolejności etapów."""
+    deals = []
+    for i in range(count):
+        entered = [0] * len(STAGE_ORDER)
+        for stage in (NEW_LEAD, MQL, SQL, WON):
+            if rnd.random() < 0.7:
+                entered[stage] = rnd.randint(first_day, last_day)
+        deals.append(Deal(id=str(10_000_000 + i), name=f"Random {i}", current_stage="New Lead",
+                          owner_name=rnd.choice(owners), entered=tuple(entered),
+                          lost_reason="", lost_description=""))
+    return deals
+
+
+def windows(rnd, count, first_day, last_day):
+    """Losowe okna (from, as_of) plus YTD / 30 dni / QTD dla kilku dni raportu."""
+    result = []
+    for _ in range(count):
+        a, b = rnd.randint(first_day - 10, last_day + 10), rnd.randint(first_day - 10, last_day + 10)
+        result.append((min(a, b), max(a, b)))
+    for _ in range(10):
+        day = date.fromordinal(rnd.randint(first_day, last_day))
+        quarter_start = date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+        for start in (date(day.year, 1, 1), day - timedelta(days=29), quarter_start):
+            result.append((start.toordinal(), day.toordinal()))
+    return result
+
+
+def check(size, days, window_count, seed):
+    rnd = random.Random(seed)
+    start = END_DATE - timedelta(days=days - 1)
+    pipeline = SyntheticPipeline(size, seed=seed, start=start.isoformat(), days=days)
+    owners = {oid: f"{f} {l}" for oid, (f, l) in pipeline.owners.items()}
+    deals = normalize_deals(list(pipeline.deals()), owners)
+    first_day, last_day = start.toordinal(), END_DATE.toordinal()
+    deals += random_deals(rnd, max(size // 5, 100), first_day, last_day, sorted(set(owners.values())))
+
+    backends = {"ConversionIndex": build_conversion_index(deals)}
+    if numpy_backend is not None:
+        backends["DealArrays"] = build_deal_arrays(deals)
+
+    checked = 0
+    for from_day, as_of_day in windows(rnd, window_count, first_day, last_day):
+        expected = calc_conversions(deals, as_of_date=day_str(as_of_day), from_date=day_str(from_day))
+        for name, index in backends.items():
+            actual = indexed_conversions(index, day_str(as_of_day), day_str(from_day))
+            if actual != expected:
+                print(f"NIEZGODNOŚĆ {name}: {size} deali, okno {day_str(from_day)} .. {day_str(as_of_day)}")
+                print(f"  calc_conversions: {expected[0]}")
+                print(f"  {name}: {actual[0]}")
+                return False
+            checked += 1
+    print(f"  {len(deals):>7} deali | {days:>4} dni | {checked} porównań ({', '.join(backends)}) - OK")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zgodność indeksów konwersji z calc_conversions")
+    parser.add_argument("--sizes", default="1000,10000", help="liczby deali syntetycznych, po przecinku")
+    parser.add_argument("--days", default="400", help="długości zakresu dat, po przecinku")
+    parser.add_argument("--windows", type=int, default=200, help="liczba losowych okien na przypadek")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = all(check(int(size), int(days), args.windows, args.seed)
+             for days in args.days.split(",") for size in args.sizes.split(","))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
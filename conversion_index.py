@@ -0,0 +1,86 @@
+"""
+Indeks konwersji dla dowolnego okna [from, as_of] bez przeliczania wszystkich deali.
+
+Deal liczy się do okna, gdy wszedł w New Lead w [from, as_of]; dalszy etap
+liczy się, gdy wszedł w niego najpóźniej as_of. Dla każdej metryki deal to
+punkt (nl, y), gdzie y = max(nl, dni kolejnych etapów), a zapytanie to
+liczba punktów z nl >= from i y <= as_of. Odpowiada na nie drzewo Fenwicka
+po dniu New Lead, którego węzły trzymają posortowane y (O(log D * log N)).
+
+Dni to ordinale (date.toordinal()), 0 = brak etapu.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class DominanceCounter:
+    """Liczy punkty (x, y) z x >= lo i y <= hi."""
+
+    def __init__(self, points, max_x):
+        self.max_x = max_x
+        # Klucz Fenwicka rośnie, gdy x maleje, więc "x >= lo" to prefiks.
+        self.size = max((max_x - x for x, _ in points), default=0) + 1
+        nodes = [[] for _ in range(self.size + 1)]
+        for x, y in points:
+            i = max_x - x + 1
+            while i <= self.size:
+                nodes[i].append(y)
+                i += i & -i
+        self.nodes = [array("i", sorted(node)) for node in nodes]
+
+    def count(self, lo, hi):
+        i = min(self.max_x - lo + 1, self.size)
+        total = 0
+        while i > 0:
+            total += bisect_right(self.nodes[i], hi)
+            i -= i & -i
+        return total
+
+
+class _Counts:
+    def __init__(self, entries):
+        self.nl_days = array("i", sorted(nl for nl, _, _ in entries))
+        max_x = self.nl_days[-1] if self.nl_days else 0
+        self.mql = DominanceCounter([(nl, max(nl, mql)) for nl, mql, _ in entries if mql], max_x)
+        self.sql = DominanceCounter([(nl, max(nl, sql)) for nl, _, sql in entries if sql], max_x)
+        self.mql_sql = DominanceCounter(
+            [(nl, max(nl, mql, sql)) for nl, mql, sql in entries if mql and sql], max_x)
+
+    def counts(self, from_day, as_of_day):
+        leads = bisect_right(self.nl_days, as_of_day) - bisect_left(self.nl_days, from_day)
+        if leads <= 0:
+            return 0, 0, 0, 0, 0
+        mql = self.mql.count(from_day, as_of_day)
+        return leads, mql, mql, self.mql_sql.count(from_day, as_of_day), self.sql.count(from_day, as_of_day)
+
+
+class ConversionIndex:
+    """Indeks konwersji Lead->MQL, MQL->SQL, Lead->SQL, ogółem i per owner.
+
+    entries: iterowalne (owner, nl, mql, sql) z dniami jako ordinale.
+    Deale bez New Lead są pomijane - nie należą do żadnego okna.
+    """
+
+    def __init__(self, entries):
+        by_owner = {}
+        everything = []
+        for owner, nl, mql, sql in entries:
+            if not nl:
+                continue
+            by_owner.setdefault(owner, []).append((nl, mql, sql))
+            everything.append((nl, mql, sql))
+        self._overall = _Counts(everything)
+        self._owners = {owner: _Counts(e) for owner, e in by_owner.items()}
+
+    @property
+    def owners(self):
+        return list(self._owners)
+
+    def counts(self, from_day, as_of_day, owner=None):
+        """Zwraca (total_leads, total_mql, lead_to_mql, mql_to_sql, lead_to_sql) dla okna."""
+        if owner is None:
+            return self._overall.counts(from_day, as_of_day)
+        counts = self._owners.get(owner)
+        if counts is None:
+            return 0, 0, 0, 0, 0
+        return counts.counts(from_day, as_of_day)
@@ -6,6 +6,7 @@
   let currentDate = '';
   let currentView = 'day'; // day | week | month
   const cache = {}; // date -> JSON data
+  const rollupCache = {}; // week/2026-W07, month/2026-02 -> JSON data
   let currentData = null; // current rendered data (for drill-down)
 
   // --- DOM refs ---
@@ -65,6 +66,20 @@
     return availableDates.filter(d => d >= start && d <= end);
   }
 
+  // ISO week key (YYYY-Www) of the week starting on the given Monday
+  function isoWeekKey(mondayStr) {
+    const thursday = new Date(addDays(mondayStr, 3) + 'T12:00:00');
+    const yearStart = new Date(thursday.getFullYear() + '-01-01T12:00:00');
+    const week = Math.floor(Math.round((thursday - yearStart) / 86400000) / 7) + 1;
+    return `${thursday.getFullYear()}-W${String(week).padStart(2, '0')}`;
+  }
+
+  function getRollupPath() {
+    if (currentView === 'week') return `week/${isoWeekKey(getMonday(currentDate))}`;
+    if (currentView === 'month') return `month/${currentDate.slice(0, 7)}`;
+    return null;
+  }
+
   function getRangeLabel() {
     if (currentView === 'day') {
       return formatDatePL(currentDate);
@@ -82,9 +97,13 @@
 
   // --- Data fetching ---
   async function fetchJSON(url) {
-    const resp = await fetch(url);
-    if (!resp.ok) return null;
-    return resp.json();
+    try {
+      const resp = await fetch(url);
+      if (!resp.ok) return null;
+      return await resp.json();
+    } catch (e) {
+      return null;
+    }
   }
 
   async function loadIndex() {
@@ -101,6 +120,13 @@
     return data;
   }
 
+  async function loadRollup(path) {
+    if (rollupCache[path]) return rollupCache[path];
+    const data = await fetchJSON(`data/${path}.json`);
+    if (data) rollupCache[path] = data;
+    return data;
+  }
+
   // --- Aggregation ---
   function pctStr(a, b) {
     return b > 0 ? `${Math.round(a / b * 100)}%` : '-';
@@ -122,6 +148,7 @@
     // Use latest day's conversions (cumulative snapshot)
     const latestData = datasets[datasets.length - 1];
     const conversions = latestData.conversions || null;
+    const conversionWindows = latestData.conversion_windows || null;
 
     for (const data of datasets) {
       const s = data.summary;
@@ -144,6 +171,7 @@
               lost_before_mql: 0, sales_lost: 0, lost_total: 0,
             },
             conversions: null,
+            conversion_windows: null,
             deals: [],
             lost_deals: [],
           };
@@ -158,8 +186,8 @@
         m.stats.lost_before_mql += st.lost_before_mql;
         m.stats.sales_lost += st.sales_lost;
         m.stats.lost_total += st.lost_total;
-        m.deals = m.deals.concat(sdr.deals);
-        m.lost_deals = m.lost_deals.concat(sdr.lost_deals);
+        m.deals = m.deals.concat(sdr.deals || []);
+        m.lost_deals = m.lost_deals.concat(sdr.lost_deals || []);
       }
 
       for (const lr of data.lost_reasons) {
@@ -173,6 +201,9 @@
         if (sdrMap[sdr.name] && sdr.conversions) {
           sdrMap[sdr.name].conversions = sdr.conversions;
         }
+        if (sdrMap[sdr.name] && sdr.conversion_windows) {
+          sdrMap[sdr.name].conversion_windows = sdr.conversion_windows;
+        }
       }
     }
 
@@ -183,15 +214,104 @@
       .sort((a, b) => b[1] - a[1])
       .map(([reason, count]) => ({ reason, count }));
 
-    return {
+    const result = {
       date: datasets.length === 1 ? datasets[0].date : null,
       generated_at: latestData.generated_at,
       summary,
       conversions,
+      conversion_windows: conversionWindows,
       active_sdrs: activeSdrs.size,
       sdr_data,
       lost_reasons,
+      deal_index: buildDealIndex(sdr_data),
     };
+
+    // Summary-only days: deal lists are aggregated later from their detail files
+    if (datasets.some(d => d.details && !d.detailsLoaded)) {
+      for (const m of sdr_data) {
+        delete m.deals;
+        delete m.lost_deals;
+      }
+      delete result.deal_index;
+      result.parts = datasets;
+    }
+    return result;
+  }
+
+  // --- Lazy details ---
+  // Summary files point at a detail file ("details") with the per-SDR deal
+  // lists and deal_index; it is fetched on the first modal or <details> open.
+  // Older files embed the lists and need nothing extra. A failed fetch leaves
+  // the data unloaded and resolves to false, so the next open retries it.
+  function attachDetails(data, details) {
+    const byName = {};
+    for (const sdr of details.sdr_data) byName[sdr.name] = sdr;
+    for (const sdr of data.sdr_data) {
+      const d = byName[sdr.name];
+      sdr.deals = d ? d.deals : [];
+      sdr.lost_deals = d ? d.lost_deals : [];
+    }
+    if (details.deal_index) data.deal_index = details.deal_index;
+    else delete data.deal_index;
+  }
+
+  function ensureDetails(data) {
+    if (!data.detailsPromise) {
+      data.detailsPromise = (async () => {
+        if (data.parts) {
+          const loaded = await Promise.all(data.parts.map(ensureDetails));
+          if (loaded.includes(false)) {
+            data.detailsPromise = null;
+            return false;
+          }
+          attachDetails(data, aggregateData(data.parts));
+        } else if (data.details) {
+          const details = await fetchJSON(`data/${data.details}`);
+          if (!details) {
+            data.detailsPromise = null;
+            return false;
+          }
+          attachDetails(data, details);
+        }
+        data.detailsLoaded = true;
+        return true;
+      })();
+    }
+    return data.detailsPromise;
+  }
+
+  // --- Deal index (same format as deal_index.py) ---
+  // Deals are numbered in sdr_data[i].deals order; offsets[i] is where SDR i
+  // starts, stages[stage] lists (ascending) positions of deals that entered it.
+  function buildDealIndex(sdrData) {
+    const offsets = [0];
+    const stages = {};
+    let pos = 0;
+    for (const sdr of sdrData) {
+      for (const d of sdr.deals) {
+        for (const st of d.stage_changes || []) {
+          (stages[st] || (stages[st] = [])).push(pos);
+        }
+        pos++;
+      }
+      offsets.push(pos);
+    }
+    return { offsets, stages };
+  }
+
+  // Files generated before the index existed get one built on first drill-down
+  function getDealIndex(data) {
+    if (!data.deal_index) data.deal_index = buildDealIndex(data.sdr_data);
+    return data.deal_index;
+  }
+
+  function lowerBound(list, value) {
+    let lo = 0, hi = list.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (list[mid] < value) lo = mid + 1; else hi = mid;
+    }
+    return lo;
   }
 
   // --- Rendering ---
@@ -236,30 +356,38 @@
   function filterDeals(data, filterKey, sdrName) {
     const stages = FILTER_STAGE_MAP[filterKey];
     if (!stages || !data) return [];
+    const index = getDealIndex(data);
     const deals = [];
-    for (const sdr of data.sdr_data) {
-      if (sdrName && sdr.name !== sdrName) continue;
-      for (const d of sdr.deals) {
-        const sc = d.stage_changes || [];
-        if (stages.some(st => sc.includes(st))) {
-          deals.push({ ...d, sdr_name: sdr.name });
-        }
+    data.sdr_data.forEach((sdr, i) => {
+      if (sdrName && sdr.name !== sdrName) return;
+      // Slice each stage's position list to this SDR's [start, end) range
+      const start = index.offsets[i];
+      const end = index.offsets[i + 1];
+      let positions = [];
+      for (const st of stages) {
+        const list = index.stages[st] || [];
+        positions = positions.concat(list.slice(lowerBound(list, start), lowerBound(list, end)));
       }
-    }
+      if (stages.length > 1) positions = [...new Set(positions)].sort((a, b) => a - b);
+      for (const pos of positions) {
+        deals.push({ ...sdr.deals[pos - start], sdr_name: sdr.name });
+      }
+    });
     return deals;
   }
 
+  // deals = null: deal lists failed to load, the modal shows an error instead
   function openModal(title, deals) {
     const existing = document.querySelector('.modal-overlay');
     if (existing) existing.remove();
 
-    if (deals.length === 0) return;
+    if (deals && deals.length === 0) return;
 
     const overlay = document.createElement('div');
     overlay.className = 'modal-overlay';
 
-    let rows = '';
-    for (const d of deals) {
+    let rows = deals ? '' : DETAIL_ERROR;
+    for (const d of deals || []) {
       const stageClass = getStageClass(d.current_stage);
       rows += `
         <div class="modal-deal">
@@ -276,7 +404,7 @@
         <div class="modal-header">
           <div style="display:flex;align-items:center">
             <h3>${escapeHTML(title)}</h3>
-            <span class="modal-count">${deals.length}</span>
+            ${deals ? `<span class="modal-count">${deals.length}</span>` : ''}
           </div>
           <button class="modal-close">&times;</button>
         </div>
@@ -291,6 +419,38 @@
     });
   }
 
+  const DETAIL_LOADING = '<div style="color:#94a3b8;font-size:13px;padding:4px 0">\u0141adowanie...</div>';
+  const DETAIL_ERROR = '<div style="color:#ef4444;font-size:13px;padding:4px 0">Nie uda\u0142o si\u0119 pobra\u0107 szczeg\u00f3\u0142\u00f3w. Spr\u00f3buj ponownie.</div>';
+
+  function renderLostDeals(sdr) {
+    let html = '';
+    for (const d of sdr.lost_deals || []) {
+      html += `
+            <div class="lost-item">
+              <div class="deal-name">${escapeHTML((d.name || '').slice(0, 60))}</div>
+              <div class="lost-meta">${escapeHTML(d.lost_type)} | ${escapeHTML(d.lost_reason)}</div>`;
+      if (d.lost_description) {
+        html += `<div class="lost-meta">${escapeHTML(d.lost_description.slice(0, 120))}</div>`;
+      }
+      html += `</div>`;
+    }
+    return html;
+  }
+
+  function renderDealList(sdr) {
+    let html = '';
+    for (const d of sdr.deals || []) {
+      const stages = Array.isArray(d.stage_changes) ? d.stage_changes.join(', ') : '';
+      html += `
+            <div style="padding:4px 0;border-bottom:1px solid #263548;font-size:13px">
+              <span style="color:#f1f5f9">${escapeHTML((d.name || '').slice(0, 50))}</span>
+              <span style="color:#64748b;margin-left:8px">(${escapeHTML(d.current_stage)})</span>
+              <div style="color:#94a3b8;font-size:11px">${escapeHTML(stages)}</div>
+            </div>`;
+    }
+    return html;
+  }
+
   function renderDashboard(data) {
     currentData = data;
 
@@ -329,6 +489,15 @@
 
     const year = (currentDate || '').slice(0, 4) || '2026';
 
+    // Rolling 30-day and quarter-to-date windows (as of the latest day)
+    const windows = data.conversion_windows || {};
+    function windowsLine(key) {
+      const parts = [];
+      if (windows['30d']) parts.push(`30 dni: ${windows['30d'][key]}`);
+      if (windows.qtd) parts.push(`QTD: ${windows.qtd[key]}`);
+      return parts.length ? `<div class="conv-windows">${escapeHTML(parts.join(' \u00b7 '))}</div>` : '';
+    }
+
     html += `
     <div class="conv-grid">
       <div class="conv-card">
@@ -336,18 +505,21 @@
         <div class="conv-tooltip">Ile lead\u00f3w z ${year} roku dosz\u0142o do MQL.<br>Liczone s\u0105 tylko deale kt\u00f3re wesz\u0142y jako New Lead w ${year}. Leady z poprzednich lat nie s\u0105 uwzgl\u0119dniane.</div>
         <div class="conv-label">Lead <span class="conv-arrow">\u2192</span> MQL</div>
         <div class="conv-value">${escapeHTML(conv.lead_mql || '-')}</div>
+        ${windowsLine('lead_mql')}
       </div>
       <div class="conv-card">
         <div class="conv-info">?</div>
         <div class="conv-tooltip">Ile MQL-i z ${year} roku dosz\u0142o do Kwalki (SQL).<br>Liczone s\u0105 tylko deale z New Lead w ${year} kt\u00f3re przesz\u0142y przez MQL i dalej do SQL.</div>
         <div class="conv-label">MQL <span class="conv-arrow">\u2192</span> SQL</div>
         <div class="conv-value">${escapeHTML(conv.mql_sql || '-')}</div>
+        ${windowsLine('mql_sql')}
       </div>
       <div class="conv-card">
         <div class="conv-info">?</div>
         <div class="conv-tooltip">Ile lead\u00f3w z ${year} roku dosz\u0142o bezpo\u015brednio do Kwalki (SQL).<br>Pokazuje konwersj\u0119 ca\u0142ego lejka \u2014 tylko rocznik ${year}.</div>
         <div class="conv-label">Lead <span class="conv-arrow">\u2192</span> SQL</div>
         <div class="conv-value">${escapeHTML(conv.lead_sql || '-')}</div>
+        ${windowsLine('lead_sql')}
       </div>
     </div>`;
 
@@ -423,7 +595,7 @@
       <h2>Szczeg\u00f3\u0142y per SDR</h2>
       <div class="sdr-cards">`;
 
-    for (const sdr of data.sdr_data) {
+    data.sdr_data.forEach((sdr, i) => {
       const st = sdr.stats;
       html += `
         <div class="sdr-card">
@@ -446,56 +618,66 @@
             <div style="margin-top:8px;padding-top:8px;border-top:1px solid #334155">
               <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">YTD Lead\u2192MQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sc.lead_mql || '-')}</span></div>
               <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">YTD MQL\u2192SQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sc.mql_sql || '-')}</span></div>
-              <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">YTD Lead\u2192SQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sc.lead_sql || '-')}</span></div>
+              <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">YTD Lead\u2192SQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sc.lead_sql || '-')}</span></div>`;
+        const sw = sdr.conversion_windows || {};
+        if (sw['30d']) {
+          html += `
+              <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">30 dni Lead\u2192MQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sw['30d'].lead_mql || '-')}</span></div>`;
+        }
+        if (sw.qtd) {
+          html += `
+              <div class="sdr-stat-row"><span class="sdr-stat-label" style="color:#64748b">QTD Lead\u2192MQL</span><span style="color:#64748b;font-size:13px">${escapeHTML(sw.qtd.lead_mql || '-')}</span></div>`;
+        }
+        html += `
             </div>`;
       }
 
-      // Lost deals details
-      if (sdr.lost_deals && sdr.lost_deals.length > 0) {
-        html += `<details><summary>Poka\u017C przyczyny lost\u00f3w</summary>`;
-        for (const d of sdr.lost_deals) {
-          html += `
-            <div class="lost-item">
-              <div class="deal-name">${escapeHTML((d.name || '').slice(0, 60))}</div>
-              <div class="lost-meta">${escapeHTML(d.lost_type)} | ${escapeHTML(d.lost_reason)}</div>`;
-          if (d.lost_description) {
-            html += `<div class="lost-meta">${escapeHTML(d.lost_description.slice(0, 120))}</div>`;
-          }
-          html += `</div>`;
-        }
-        html += `</details>`;
+      // Lost deals / deal list: rendered now if loaded, else filled in on first open
+      const lostCount = sdr.lost_deals ? sdr.lost_deals.length : st.lost_total;
+      if (lostCount > 0) {
+        html += `<details data-detail="lost" data-sdr-index="${i}"${sdr.lost_deals ? ' data-loaded="1"' : ''}><summary>Poka\u017C przyczyny lost\u00f3w</summary><div class="detail-body">${sdr.lost_deals ? renderLostDeals(sdr) : DETAIL_LOADING}</div></details>`;
       }
 
-      // Deals list
-      if (sdr.deals && sdr.deals.length > 0) {
-        html += `<details><summary>Poka\u017C list\u0119 deali</summary><div style="margin-top:8px">`;
-        for (const d of sdr.deals) {
-          const stages = Array.isArray(d.stage_changes) ? d.stage_changes.join(', ') : '';
-          html += `
-            <div style="padding:4px 0;border-bottom:1px solid #263548;font-size:13px">
-              <span style="color:#f1f5f9">${escapeHTML((d.name || '').slice(0, 50))}</span>
-              <span style="color:#64748b;margin-left:8px">(${escapeHTML(d.current_stage)})</span>
-              <div style="color:#94a3b8;font-size:11px">${escapeHTML(stages)}</div>
-            </div>`;
-        }
-        html += `</div></details>`;
+      const dealCount = sdr.deals ? sdr.deals.length : st.total;
+      if (dealCount > 0) {
+        html += `<details data-detail="deals" data-sdr-index="${i}"${sdr.deals ? ' data-loaded="1"' : ''}><summary>Poka\u017C list\u0119 deali</summary><div class="detail-body" style="margin-top:8px">${sdr.deals ? renderDealList(sdr) : DETAIL_LOADING}</div></details>`;
       }
 
       html += `
           </div>
         </div>`;
-    }
+    });
 
     html += `</div></div>`;
 
     container.innerHTML = html;
 
+    // Fill lazy <details> sections on first open
+    container.querySelectorAll('details[data-detail]').forEach(el => {
+      el.addEventListener('toggle', async () => {
+        if (!el.open || el.dataset.loaded) return;
+        el.dataset.loaded = '1';
+        const body = el.querySelector('.detail-body');
+        if (!await ensureDetails(data)) {
+          // Retry on the next open
+          delete el.dataset.loaded;
+          body.innerHTML = DETAIL_ERROR;
+          return;
+        }
+        const sdr = data.sdr_data[Number(el.dataset.sdrIndex)];
+        body.innerHTML = el.dataset.detail === 'lost' ? renderLostDeals(sdr) : renderDealList(sdr);
+      });
+    });
+
     // Attach drill-down click handlers
     container.querySelectorAll('[data-filter]').forEach(el => {
-      el.addEventListener('click', () => {
+      el.addEventListener('click', async () => {
         const filterKey = el.dataset.filter;
         const sdrName = el.dataset.sdr || null;
-        const deals = filterDeals(currentData, filterKey, sdrName);
+        const shown = currentData;
+        const loaded = await ensureDetails(shown);
+        if (shown !== currentData) return;
+        const deals = loaded ? filterDeals(shown, filterKey, sdrName) : null;
         const label = FILTER_LABELS[filterKey] || filterKey;
         const title = sdrName ? `${label} - ${sdrName}` : label;
         openModal(title, deals);
@@ -575,6 +757,16 @@
       return;
     }
 
+    // Week/month view: one pre-aggregated file, per-day files only as fallback
+    const rollupPath = getRollupPath();
+    if (rollupPath) {
+      const rollup = await loadRollup(rollupPath);
+      if (rollup) {
+        renderDashboard(rollup);
+        return;
+      }
+    }
+
     const datasets = [];
     for (const date of dates) {
       const data = await loadDayData(date);
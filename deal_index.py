@@ -0,0 +1,25 @@
+"""
+Indeks deali dnia / zestawienia do drill-downu w dashboardzie.
+
+Deale payloadu numerowane są w kolejności sdr_data[i].deals (jedna ciągła
+lista po wszystkich SDR-ach). Indeks trzyma:
+  offsets  - początek listy deali każdego SDR-a (len(sdr_data) + 1 wartości),
+  stages   - etap -> rosnące pozycje deali, które weszły w niego w tym okresie.
+
+Dashboard wybiera deale dla KPI i dla SDR-a wycinkiem listy pozycji
+(wyszukiwanie binarne po offsets) zamiast przeglądać wszystkie deale.
+"""
+from collections import defaultdict
+
+
+def build_deal_index(sdr_data):
+    offsets = [0]
+    stages = defaultdict(list)
+    pos = 0
+    for sdr in sdr_data:
+        for d in sdr["deals"]:
+            for stage in d["stage_changes"]:
+                stages[stage].append(pos)
+            pos += 1
+        offsets.append(pos)
+    return {"offsets": offsets, "stages": dict(stages)}
@@ -0,0 +1,112 @@
+"""
+Lokalny magazyn deali z pipeline SDR.
+
+Trzyma ostatni znany stan każdego deala (klucz: id) oraz watermark ostatniej
+udanej synchronizacji, żeby kolejne uruchomienia mogły pobierać z HubSpot
+tylko deale zmodyfikowane od tego czasu.
+
+Delta nie widzi deali usuniętych w HubSpot, dlatego magazyn pamięta też
+czas ostatniej pełnej synchronizacji (last_full_sync) - starszy niż
+FULL_SYNC_MAX_AGE_DAYS (domyślnie 7 dni) wymusza pełne pobranie.
+"""
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+STORE_VERSION = 1
+
+# Indeks wyszukiwania HubSpot bywa opóźniony - cofamy watermark o zapas,
+# żeby nie zgubić deali zmienionych tuż przed poprzednią synchronizacją.
+WATERMARK_OVERLAP = timedelta(hours=1)
+
+FULL_SYNC_MAX_AGE = timedelta(days=float(os.getenv("FULL_SYNC_MAX_AGE_DAYS", "7")))
+
+
+def default_store_path():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv("DEAL_STORE_PATH") or os.path.join(script_dir, "cache", "deal_store.json")
+
+
+def empty_store():
+    return {"version": STORE_VERSION, "watermark": None, "last_full_sync": None, "deals": {}}
+
+
+def load_store(path):
+    """Wczytuje magazyn z dysku. Brak pliku lub inna wersja = pusty magazyn."""
+    if not os.path.exists(path):
+        return empty_store()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        print(f"  Uszkodzony magazyn deali ({path}) - pełna synchronizacja")
+        return empty_store()
+    if store.get("version") != STORE_VERSION:
+        return empty_store()
+    return store
+
+
+def save_store(store, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(store, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def merge_deals(store, deals, pipeline_id):
+    """Nadpisuje/dodaje deale w magazynie, usuwając te, które opuściły pipeline.
+
+    deals: surowe deale z property "pipeline" (delta pobierana jest ze
+    wszystkich pipeline'ów, żeby przeniesione deale dało się wykryć).
+    Zwraca (liczba nowych, liczba usuniętych).
+    """
+    known = store["deals"]
+    added = removed = 0
+    for deal in deals:
+        if deal["properties"].get("pipeline") != pipeline_id:
+            if known.pop(deal["id"], None) is not None:
+                removed += 1
+            continue
+        if deal["id"] not in known:
+            added += 1
+        known[deal["id"]] = deal
+    return added, removed
+
+
+def replace_deals(store, deals):
+    store["deals"] = {deal["id"]: deal for deal in deals}
+
+
+def max_deal_id(store):
+    """Największe znane id deala (HubSpot nadaje rosnące id) albo None."""
+    return max((int(deal_id) for deal_id in store["deals"]), default=None)
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def delta_since(store, now=None):
+    """Zwraca timestamp (ISO, UTC) od którego trzeba pobrać zmiany, albo None (pełna synchronizacja).
+
+    None także wtedy, gdy ostatnia pełna synchronizacja jest starsza niż
+    FULL_SYNC_MAX_AGE - tylko ona usuwa deale skasowane w HubSpot.
+    """
+    watermark = store.get("watermark")
+    last_full = store.get("last_full_sync")
+    if not watermark or not last_full:
+        return None
+    now = now or datetime.now(timezone.utc)
+    if now - parse_timestamp(last_full) > FULL_SYNC_MAX_AGE:
+        return None
+    dt = parse_timestamp(watermark) - WATERMARK_OVERLAP
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def sync_started_at():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def all_deals(store):
+    return list(store["deals"].values())
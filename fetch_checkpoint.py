@@ -0,0 +1,109 @@
+"""
+Checkpoint pobierania search API - przerwany backfill wznawia od ostatniej strony.
+
+Plik JSONL, dopisywany po każdej pobranej stronie:
+  {"query": ..., "created_at": ...}                nagłówek (odcisk zapytania, czas utworzenia UTC),
+  {"plan": [[start, end], ...]}                    podział na zakresy hs_object_id,
+  {"key": ..., "after": ..., "results": [...]}     strona wyników zakresu `key`.
+
+after = null oznacza, że zakres jest pobrany w całości. Ucięta ostatnia
+linia (przerwanie w trakcie zapisu) jest ignorowana. Checkpoint innego
+zapytania albo starszy niż max_age (deale w HubSpot zdążyły się zmienić)
+jest odrzucany i zaczynany od nowa.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_MAX_AGE = timedelta(hours=24)
+
+
+def query_fingerprint(object_type, payload):
+    body = {k: v for k, v in payload.items() if k != "after"}
+    canonical = json.dumps([object_type, body], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def format_age(age):
+    hours, rest = divmod(int(age.total_seconds()), 3600)
+    return f"{hours} h {rest // 60} min"
+
+
+class SearchCheckpoint:
+    def __init__(self, path, query, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.query = query
+        self.max_age = max_age
+        self.plan = None
+        self.ranges = {}
+        if not self._load():
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"query": query, "created_at": created_at}) + "\n")
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0])
+            if header.get("query") != self.query:
+                return False
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(header["created_at"])
+        except (IndexError, ValueError, KeyError, TypeError):
+            return False
+        if age > self.max_age:
+            print(f"  Checkpoint {self.path} ma {format_age(age)} (limit {format_age(self.max_age)}) - pobieram od nowa")
+            return False
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if "plan" in entry:
+                self.plan = [tuple(r) for r in entry["plan"]]
+                continue
+            state = self.ranges.setdefault(entry["key"], {"results": [], "after": None})
+            state["results"].extend(entry["results"])
+            state["after"] = entry["after"]
+
+        pages = sum(len(s["results"]) for s in self.ranges.values())
+        print(f"  Wznawiam z checkpointu {self.path} sprzed {format_age(age)}: "
+              f"{pages} rekordów, {len(self.ranges)} zakresów")
+        return True
+
+    def progress(self, key):
+        """(wyniki, after) zapisane dla zakresu albo None, gdy zakres nie był pobierany."""
+        state = self.ranges.get(key)
+        if state is None:
+            return None
+        return state["results"], state["after"]
+
+    def release(self, key):
+        """Zwalnia z pamięci wczytane wyniki zakresu (zostaje tylko kursor)."""
+        self.ranges[key]["results"] = []
+
+    def set_plan(self, ranges):
+        self.plan = list(ranges)
+        self._append({"plan": [list(r) for r in self.plan]})
+
+    def record_page(self, key, results, after):
+        self._append({"key": key, "after": after, "results": results})
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        """Usuwa checkpoint po udanym pobraniu."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,38 +1,27 @@
 import os
-import json
-import time
-import requests
+import asyncio
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from collections import defaultdict
 
-load_dotenv()
-
+import deal_store
+import instrumentation
+import owners_cache
+from conversion_index import ConversionIndex
+from deal_index import build_deal_index
+from history_store import HistoryStore
+from rollups import write_rollups
+from output_writer import OutputBatch
+from generate_dashboard import snapshot_path, write_html
+from hubspot_client import HubSpotClient
+
+try:
+    import numpy_backend
+except ImportError:
+    numpy_backend = None
 
-def api_request(method, url, **kwargs):
-    """Wrapper z retry na 429 rate limit i timeout."""
-    kwargs.setdefault("timeout", 60)
-    for attempt in range(8):
-        try:
-            r = method(url, **kwargs)
-        except requests.exceptions.ReadTimeout:
-            print(f"  Timeout - czekam 10s (próba {attempt+1}/8)...")
-            time.sleep(10)
-            continue
-        except requests.exceptions.ConnectionError:
-            print(f"  Connection error - czekam 15s (próba {attempt+1}/8)...")
-            time.sleep(15)
-            continue
-        if r.status_code == 429:
-            wait = max(int(r.headers.get("Retry-After", 30)), 30)
-            print(f"  Rate limit - czekam {wait}s (próba {attempt+1}/8)...")
-            time.sleep(wait)
-            continue
-        return r
-    return r
+load_dotenv()
 
-token = os.getenv("HUBSPOT_API_TOKEN")
-headers = {"Authorization": f"Bearer {token}"}
 
 SDR_PIPELINE_ID = "194381550"
 EXCLUDE_OWNERS = ["Damian Jagusiak"]
@@ -59,20 +48,11 @@ DATE_ENTERED_FIELDS = {
     "hs_v2_date_entered_344689651": "Lost Before MQL",
 }
 
-# Stage IDs for date_entered lookups
-STAGE_DATE_FIELDS = {
-    "New Lead": "hs_v2_date_entered_344689645",
-    "MQL": "hs_v2_date_entered_344689652",
-    "Kwalka (SQL)": "hs_v2_date_entered_344689650",
-    "Sales Won": "hs_v2_date_entered_3981279427",
-    "Sales Lost": "hs_v2_date_entered_3938055393",
-    "Lost Before MQL": "hs_v2_date_entered_344689651",
-}
-
-PROPERTIES = [
-    "dealname", "dealstage", "hubspot_owner_id", "createdate",
-    "closedate", "hs_lastmodifieddate", "amount",
-    "lost_reason", "lost_description", "closed_lost_reason",
+# Properties pobierane przez search API - tylko to, co czyta normalize_deal.
+# lost_description jest dociągany osobno (batch/read) wyłącznie dla deali
+# straconych w publikowanych dniach - patrz fetch_lost_descriptions().
+SEARCH_PROPERTIES = [
+    "dealname", "dealstage", "hubspot_owner_id", "lost_reason", "closed_lost_reason",
 ] + list(DATE_ENTERED_FIELDS.keys())
 
 
@@ -83,237 +63,412 @@ def get_report_date():
     return yesterday.strftime("%Y-%m-%d")
 
 
-def get_owners():
-    r = api_request(requests.get, "https://api.hubapi.com/crm/v3/owners?limit=200", headers=headers)
-    owners = {}
-    for o in r.json().get("results", []):
-        owners[o["id"]] = f"{o.get('firstName', '')} {o.get('lastName', '')}".strip()
-    return owners
-
-
-def fetch_all_pipeline_deals():
-    """Pobiera WSZYSTKIE deale z pipeline SDR (bez filtra po dacie)."""
-    all_deals = []
-    after = None
-    while True:
-        payload = {
-            "filterGroups": [{"filters": [
-                {"propertyName": "pipeline", "operator": "EQ", "value": SDR_PIPELINE_ID},
-            ]}],
-            "properties": PROPERTIES,
-            "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "DESCENDING"}],
-            "limit": 100
-        }
-        if after:
-            payload["after"] = after
+def pipeline_search_payload(modified_since=None, after_id=None, all_pipelines=False):
+    """Payload search API dla deali z pipeline SDR.
+
+    modified_since: jeśli podane (ISO), tylko deale z hs_lastmodifieddate >= modified_since.
+    after_id: jeśli podane, tylko deale z hs_object_id > after_id (nowe deale).
+    all_pipelines: bez filtra po pipeline, z property "pipeline" - delta musi
+        widzieć deale przeniesione z pipeline SDR, żeby usunąć je z magazynu.
+    """
+    filters = [] if all_pipelines else [{"propertyName": "pipeline", "operator": "EQ", "value": SDR_PIPELINE_ID}]
+    if modified_since:
+        filters.append({"propertyName": "hs_lastmodifieddate", "operator": "GTE", "value": modified_since})
+    if after_id is not None:
+        filters.append({"propertyName": "hs_object_id", "operator": "GT", "value": str(after_id)})
+    return {
+        "filterGroups": [{"filters": filters}],
+        "properties": SEARCH_PROPERTIES + (["pipeline"] if all_pipelines else []),
+        "sorts": [{"propertyName": "hs_object_id", "direction": "ASCENDING"}],
+        "limit": 100
+    }
+
+
+async def fetch_all_pipeline_deals(client, modified_since=None, checkpoint=None):
+    """Pobiera WSZYSTKIE deale z pipeline SDR (bez filtra po dacie).
+
+    checkpoint: opcjonalny SearchCheckpoint do wznawiania przerwanego pobierania.
+    """
+    payload = pipeline_search_payload(modified_since)
+    return await client.search_partitioned("deals", payload, checkpoint=checkpoint)
+
+
+def iter_pipeline_deals(client, modified_since=None, checkpoint=None):
+    """Jak fetch_all_pipeline_deals, ale async generator stron (list deali) w kolejności nadejścia."""
+    return client.iter_partitioned("deals", pipeline_search_payload(modified_since), checkpoint=checkpoint)
+
+
+async def fetch_lost_descriptions(deals):
+    """Dociąga lost_description (batch/read) dla podanych deali (Deal) i wpisuje go w nie."""
+    if not deals:
+        return
+    async with HubSpotClient() as client:
+        results = await client.batch_read("deals", [d.id for d in deals], ["lost_description"])
+    descriptions = {r["id"]: r["properties"].get("lost_description") or "" for r in results}
+    for d in deals:
+        d.lost_description = descriptions.get(d.id, d.lost_description)
+
+
+async def refresh_known_deals(client, deal_ids):
+    """Odświeża znane deale przez batch/read (po 100 id, równolegle).
+
+    Zwraca deale nadal będące w pipeline SDR - usunięte i przeniesione
+    do innego pipeline'u wypadają.
+    """
+    results = await client.batch_read("deals", deal_ids, SEARCH_PROPERTIES + ["pipeline"])
+    return [r for r in results if r["properties"].get("pipeline") == SDR_PIPELINE_ID]
+
+
+async def sync_pipeline_deals(client, store_path=None):
+    """Synchronizuje lokalny magazyn deali i zwraca pełną listę deali z pipeline.
 
-        r = api_request(requests.post,
-            "https://api.hubapi.com/crm/v3/objects/deals/search",
-            headers=headers, json=payload
+    SYNC_MODE=full wymusza pełne pobranie; domyślnie (delta) pobierane są tylko
+    deale zmodyfikowane od ostatniego watermarku - ze wszystkich pipeline'ów,
+    żeby deale przeniesione poza pipeline SDR wypadły z magazynu. Bez magazynu
+    albo gdy ostatnia pełna synchronizacja jest starsza niż
+    FULL_SYNC_MAX_AGE_DAYS - pełne pobranie (usuwa też deale skasowane).
+
+    SYNC_MODE=refresh odświeża wszystkie znane deale przez batch/read (limit
+    ogólny), a search (ostrzejszy limit) służy tylko do wykrycia nowych deali
+    (hs_object_id większe niż największe znane). Deal starszy niż ostatni znany,
+    przeniesiony do pipeline SDR później, pojawi się dopiero po SYNC_MODE=full.
+    """
+    store_path = store_path or deal_store.default_store_path()
+    store = deal_store.load_store(store_path)
+    mode = os.getenv("SYNC_MODE", "delta")
+    since = None if mode == "full" else deal_store.delta_since(store)
+    started_at = deal_store.sync_started_at()
+
+    if mode == "refresh" and store["deals"]:
+        known_ids = list(store["deals"])
+        refreshed, discovered = await asyncio.gather(
+            refresh_known_deals(client, known_ids),
+            client.search_partitioned("deals", pipeline_search_payload(after_id=deal_store.max_deal_id(store))),
         )
-        if r.status_code != 200:
-            print(f"API error: {r.status_code}")
-            break
+        deal_store.replace_deals(store, sorted(refreshed + discovered, key=lambda d: int(d["id"])))
+        print(f"Odświeżenie batch/read: {len(refreshed)} z {len(known_ids)} znanych, "
+              f"{len(discovered)} nowych z search")
+    elif since:
+        payload = pipeline_search_payload(modified_since=since, all_pipelines=True)
+        changed = await client.search_partitioned("deals", payload)
+        added, removed = deal_store.merge_deals(store, changed, SDR_PIPELINE_ID)
+        print(f"Delta sync od {since}: {len(changed)} zmienionych, {added} nowych, "
+              f"{removed} usuniętych z pipeline")
+    else:
+        deals = await fetch_all_pipeline_deals(client)
+        deal_store.replace_deals(store, deals)
+        store["last_full_sync"] = started_at
+        print(f"Pełna synchronizacja: {len(deals)} deali")
 
-        data = r.json()
-        all_deals.extend(data.get("results", []))
-        after = data.get("paging", {}).get("next", {}).get("after")
-        if not after:
-            break
+    store["watermark"] = started_at
+    deal_store.save_store(store, store_path)
+    return deal_store.all_deals(store)
 
-    return all_deals
 
+async def fetch_owners_and_deals():
+    """Synchronizuje deale z pipeline i rozwiązuje ich ownerów przez cache ownerów.
+
+    Ownerzy (cache albo odświeżenie po TTL) pobierani są równolegle z
+    synchronizacją deali. Dopiero gdy deale odwołują się do ownerów spoza
+    tej listy, cache jest sprawdzany ponownie z ich id.
+    """
+    async with HubSpotClient() as client:
+        owners, all_deals = await asyncio.gather(
+            instrumentation.timed("fetch_owners", owners_cache.get_owners(client)),
+            instrumentation.timed("fetch_deals", sync_pipeline_deals(client)),
+        )
+        missing = owners_cache.owner_ids(all_deals) - set(owners)
+        if missing:
+            owners = await instrumentation.timed("fetch_owners", owners_cache.get_owners(client, missing))
+        return owners, all_deals
+
+
+# Kolejność etapów w Deal.entered (jak w DATE_ENTERED_FIELDS)
+STAGE_ORDER = list(DATE_ENTERED_FIELDS.values())
+ENTERED_FIELDS = list(DATE_ENTERED_FIELDS.keys())
+NEW_LEAD, IN_PROGRESS, CALL_SCHEDULED, MQL, SQL, WON, SALES_LOST, LOST_BEFORE_MQL = range(len(STAGE_ORDER))
 
-def is_date_match(date_str, target_date):
-    if not date_str:
-        return False
-    try:
-        dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-        return dt.strftime("%Y-%m-%d") == target_date
-    except:
-        return False
 
+class Deal:
+    """Znormalizowany deal z pipeline SDR.
 
-def get_entry_date(props, field):
-    """Wyciaga date YYYY-MM-DD z pola date_entered."""
-    val = props.get(field)
+    entered: krotka dni wejścia w etapy (date.toordinal(), 0 = brak) w kolejności STAGE_ORDER.
+    """
+    __slots__ = ("id", "name", "current_stage", "owner_name", "entered", "lost_reason", "lost_description")
+
+    def __init__(self, id, name, current_stage, owner_name, entered, lost_reason, lost_description):
+        self.id = id
+        self.name = name
+        self.current_stage = current_stage
+        self.owner_name = owner_name
+        self.entered = entered
+        self.lost_reason = lost_reason
+        self.lost_description = lost_description
+
+    def stage_changes(self, day):
+        """Nazwy etapów, w które deal wszedł danego dnia (ordinal)."""
+        return [STAGE_ORDER[i] for i, d in enumerate(self.entered) if d == day]
+
+    def is_lost_on(self, day):
+        return self.entered[SALES_LOST] == day or self.entered[LOST_BEFORE_MQL] == day
+
+
+def to_day(date_str):
+    """YYYY-MM-DD -> ordinal dnia."""
+    return date.fromisoformat(date_str).toordinal()
+
+
+def day_str(day):
+    """Ordinal dnia -> YYYY-MM-DD."""
+    return date.fromordinal(day).isoformat()
+
+
+def parse_entry_day(val):
+    """Zamienia timestamp z pola date_entered na ordinal dnia (0 gdy brak/błędny)."""
     if not val:
-        return None
+        return 0
     try:
-        return datetime.fromisoformat(val.replace("Z", "+00:00")).strftime("%Y-%m-%d")
-    except:
-        return None
+        return datetime.fromisoformat(val.replace("Z", "+00:00")).toordinal()
+    except ValueError:
+        return 0
 
 
-def process_deals(all_deals, owners, report_date):
+def normalize_deal(deal, owners):
+    """Zamienia surowy deal z HubSpot na Deal. Zwraca None dla wykluczonych ownerów."""
+    props = deal["properties"]
+    owner_name = owners.get(props.get("hubspot_owner_id"), "Nieznany")
+    if owner_name in EXCLUDE_OWNERS:
+        return None
+    return Deal(
+        id=deal.get("id"),
+        name=props.get("dealname", "?"),
+        current_stage=STAGES.get(props.get("dealstage"), props.get("dealstage")),
+        owner_name=owner_name,
+        entered=tuple(parse_entry_day(props.get(field)) for field in ENTERED_FIELDS),
+        lost_reason=props.get("lost_reason") or props.get("closed_lost_reason") or "",
+        lost_description=props.get("lost_description") or "",
+    )
+
+
+def normalize_deals(all_deals, owners):
+    """Normalizuje surowe deale (pomija wykluczonych ownerów)."""
+    deals = []
+    for raw in all_deals:
+        deal = normalize_deal(raw, owners)
+        if deal is not None:
+            deals.append(deal)
+    return deals
+
+
+def process_deals(deals, report_date):
     """Filtruje deale z aktywnością w danym dniu (zmiana etapu)."""
-    today_deals = []
-    for deal in all_deals:
-        props = deal["properties"]
-        owner_name = owners.get(props.get("hubspot_owner_id"), "Nieznany")
-        if owner_name in EXCLUDE_OWNERS:
-            continue
-
-        stage_changes = {}
-        for field, stage_name in DATE_ENTERED_FIELDS.items():
-            if is_date_match(props.get(field), report_date):
-                stage_changes[stage_name] = props.get(field)
-
-        if stage_changes:
-            today_deals.append({
-                "name": props.get("dealname", "?"),
-                "current_stage": STAGES.get(props.get("dealstage"), props.get("dealstage")),
-                "owner_name": owner_name,
-                "stage_changes": stage_changes,
-                "lost_reason": props.get("lost_reason") or props.get("closed_lost_reason") or "",
-                "lost_description": props.get("lost_description") or "",
-            })
-    return today_deals
+    day = to_day(report_date)
+    return [d for d in deals if day in d.entered]
 
 
-def calc_stats(deals):
+def calc_stats(deals, day):
     """Liczy aktywność dnia (ile deali weszło w dany etap TEGO DNIA)."""
-    new_l = sum(1 for d in deals if "New Lead" in d["stage_changes"])
-    mql = sum(1 for d in deals if "MQL" in d["stage_changes"])
-    sql = sum(1 for d in deals if "Kwalka (SQL)" in d["stage_changes"])
-    won = sum(1 for d in deals if "Sales Won" in d["stage_changes"])
-    lost_bm = sum(1 for d in deals if "Lost Before MQL" in d["stage_changes"])
-    lost_s = sum(1 for d in deals if "Sales Lost" in d["stage_changes"])
+    counts = [0] * len(STAGE_ORDER)
+    for d in deals:
+        for i, entered in enumerate(d.entered):
+            if entered == day:
+                counts[i] += 1
+    return stats_from_counts(len(deals), counts)
+
+
+def stats_from_counts(total, counts):
+    """Słownik statystyk dnia z liczby deali i liczników wejść per etap (kolejność STAGE_ORDER)."""
+    lost_bm = counts[LOST_BEFORE_MQL]
+    lost_s = counts[SALES_LOST]
 
     return {
-        "total": len(deals),
-        "new_lead": new_l,
-        "mql": mql,
-        "sql": sql,
-        "won": won,
+        "total": total,
+        "new_lead": counts[NEW_LEAD],
+        "mql": counts[MQL],
+        "sql": counts[SQL],
+        "won": counts[WON],
         "lost_before_mql": lost_bm,
         "sales_lost": lost_s,
         "lost_total": lost_bm + lost_s,
     }
 
 
-def calc_conversions(all_deals, owners, as_of_date=None, from_date=None):
+def pct(a, b):
+    return f"{a/b*100:.0f}%" if b > 0 else "-"
+
+
+def conv_metrics_from_counts(total_leads, total_mql, lead_to_mql, mql_to_sql, lead_to_sql):
+    """Buduje słownik konwersji (format JSON dashboardu) z gotowych liczników."""
+    return {
+        "total_leads": total_leads,
+        "total_mql": total_mql,
+        "lead_mql": f"{lead_to_mql}/{total_leads} ({pct(lead_to_mql, total_leads)})" if total_leads > 0 else "-",
+        "lead_mql_num": lead_to_mql,
+        "lead_mql_denom": total_leads,
+        "mql_sql": f"{mql_to_sql}/{total_mql} ({pct(mql_to_sql, total_mql)})" if total_mql > 0 else "-",
+        "mql_sql_num": mql_to_sql,
+        "mql_sql_denom": total_mql,
+        "lead_sql": f"{lead_to_sql}/{total_leads} ({pct(lead_to_sql, total_leads)})" if total_leads > 0 else "-",
+        "lead_sql_num": lead_to_sql,
+        "lead_sql_denom": total_leads,
+    }
+
+
+def calc_conversions(deals, as_of_date=None, from_date=None):
     """Liczy konwersje z deali w pipeline.
 
     as_of_date: jeśli podane, liczy tylko etapy wejściowe do tej daty (snapshot historyczny).
     from_date: jeśli podane, liczy tylko deale z New Lead >= from_date (np. "2026-01-01").
     """
-
-    def pct(a, b):
-        return f"{a/b*100:.0f}%" if b > 0 else "-"
-
-    def conv_metrics(infos):
-        total_leads = sum(1 for d in infos if d["nl"])
-        total_mql = sum(1 for d in infos if d["mql"])
-        lead_to_mql = sum(1 for d in infos if d["nl"] and d["mql"])
-        mql_to_sql = sum(1 for d in infos if d["mql"] and d["sql"])
-        lead_to_sql = sum(1 for d in infos if d["nl"] and d["sql"])
-
-        return {
-            "total_leads": total_leads,
-            "total_mql": total_mql,
-            "lead_mql": f"{lead_to_mql}/{total_leads} ({pct(lead_to_mql, total_leads)})" if total_leads > 0 else "-",
-            "lead_mql_num": lead_to_mql,
-            "lead_mql_denom": total_leads,
-            "mql_sql": f"{mql_to_sql}/{total_mql} ({pct(mql_to_sql, total_mql)})" if total_mql > 0 else "-",
-            "mql_sql_num": mql_to_sql,
-            "mql_sql_denom": total_mql,
-            "lead_sql": f"{lead_to_sql}/{total_leads} ({pct(lead_to_sql, total_leads)})" if total_leads > 0 else "-",
-            "lead_sql_num": lead_to_sql,
-            "lead_sql_denom": total_leads,
-        }
-
-    deal_infos = []
-    for deal in all_deals:
-        props = deal["properties"]
-        owner_name = owners.get(props.get("hubspot_owner_id"), "Nieznany")
-        if owner_name in EXCLUDE_OWNERS:
-            continue
-
-        nl = get_entry_date(props, STAGE_DATE_FIELDS["New Lead"])
-        mql = get_entry_date(props, STAGE_DATE_FIELDS["MQL"])
-        sql = get_entry_date(props, STAGE_DATE_FIELDS["Kwalka (SQL)"])
-        won = get_entry_date(props, STAGE_DATE_FIELDS["Sales Won"])
+    as_of = to_day(as_of_date) if as_of_date else 0
+    start = to_day(from_date) if from_date else 0
+
+    # Liczniki per owner: total_leads, total_mql, lead_to_mql, mql_to_sql, lead_to_sql
+    by_owner = {}
+    for deal in deals:
+        entered = deal.entered
+        nl = entered[NEW_LEAD]
+        mql = entered[MQL]
+        sql = entered[SQL]
+        won = entered[WON]
 
         # Snapshot historyczny - odcinamy etapy po dacie
-        if as_of_date:
-            if nl and nl > as_of_date:
-                nl = None
-            if mql and mql > as_of_date:
-                mql = None
-            if sql and sql > as_of_date:
-                sql = None
-            if won and won > as_of_date:
-                won = None
+        if as_of:
+            if nl > as_of:
+                nl = 0
+            if mql > as_of:
+                mql = 0
+            if sql > as_of:
+                sql = 0
+            if won > as_of:
+                won = 0
 
         # Filtr roku - liczymy tylko deale z New Lead >= from_date
-        if from_date and (not nl or nl < from_date):
+        if start and (not nl or nl < start):
             continue
 
         # Pomijamy deale które jeszcze nie weszly w pipeline na ten dzien
         if not nl and not mql and not sql and not won:
             continue
 
-        deal_infos.append({
-            "owner_name": owner_name,
-            "nl": nl,
-            "mql": mql,
-            "sql": sql,
-            "won": won,
-        })
-
-    overall = conv_metrics(deal_infos)
+        counts = by_owner.get(deal.owner_name)
+        if counts is None:
+            counts = by_owner[deal.owner_name] = [0, 0, 0, 0, 0]
+        if nl:
+            counts[0] += 1
+        if mql:
+            counts[1] += 1
+        if nl and mql:
+            counts[2] += 1
+        if mql and sql:
+            counts[3] += 1
+        if nl and sql:
+            counts[4] += 1
+
+    totals = [sum(c[i] for c in by_owner.values()) for i in range(5)]
+    overall = conv_metrics_from_counts(*totals)
 
     # Per SDR
-    by_owner = defaultdict(list)
-    for d in deal_infos:
-        by_owner[d["owner_name"]].append(d)
+    sdr_conv = {owner: conv_metrics_from_counts(*counts) for owner, counts in by_owner.items()}
+
+    return overall, sdr_conv
+
+
+def build_conversion_index(deals):
+    return ConversionIndex((d.owner_name, d.entered[NEW_LEAD], d.entered[MQL], d.entered[SQL]) for d in deals)
 
-    sdr_conv = {}
-    for owner, deals in by_owner.items():
-        sdr_conv[owner] = conv_metrics(deals)
 
+def numpy_enabled():
+    """Czy liczyć backendem NumPy. SDR_BACKEND: auto (domyślnie, gdy numpy jest), numpy, python."""
+    backend = os.getenv("SDR_BACKEND", "auto")
+    if backend == "numpy" and numpy_backend is None:
+        raise RuntimeError("SDR_BACKEND=numpy wymaga pakietu numpy (pip install numpy)")
+    return numpy_backend is not None and backend != "python"
+
+
+def build_deal_arrays(deals):
+    """DealArrays (backend NumPy) - zastępuje process_deals, calc_stats i ConversionIndex."""
+    return numpy_backend.DealArrays(deals, len(STAGE_ORDER), NEW_LEAD, MQL, SQL)
+
+
+def arrays_day_stats(arrays, day):
+    """(statystyki ogółem, {owner: statystyki}) dnia z DealArrays - jak calc_stats w build_json."""
+    totals, per_stage = arrays.day_counts(day)
+    overall_counts = [sum(c[i] for c in per_stage.values()) for i in range(len(STAGE_ORDER))]
+    overall = stats_from_counts(sum(totals.values()), overall_counts)
+    return overall, {owner: stats_from_counts(totals[owner], per_stage[owner]) for owner in totals}
+
+
+def indexed_conversions(index, as_of_date, from_date):
+    """Jak calc_conversions(deals, as_of_date, from_date), ale z ConversionIndex."""
+    as_of = to_day(as_of_date)
+    start = to_day(from_date)
+    overall = conv_metrics_from_counts(*index.counts(start, as_of))
+    sdr_conv = {}
+    for owner in index.owners:
+        counts = index.counts(start, as_of, owner)
+        if counts[0]:
+            sdr_conv[owner] = conv_metrics_from_counts(*counts)
     return overall, sdr_conv
 
 
-def build_json(today_deals, report_date, conversions=None, sdr_conversions=None):
+def conversion_windows(index, report_date):
+    """Konwersje dla okien kroczących (30 dni) i od początku kwartału.
+
+    Zwraca (overall, sdr): {okno: konwersje} i {owner: {okno: konwersje}}.
+    """
+    day = date.fromisoformat(report_date)
+    windows = {
+        "30d": (day - timedelta(days=29)).isoformat(),
+        "qtd": date(day.year, 3 * ((day.month - 1) // 3) + 1, 1).isoformat(),
+    }
+    overall = {}
+    sdr = defaultdict(dict)
+    for name, from_date in windows.items():
+        overall[name], sdr_conv = indexed_conversions(index, report_date, from_date)
+        for owner, conv in sdr_conv.items():
+            sdr[owner][name] = conv
+    return overall, dict(sdr)
+
+
+def build_json(today_deals, report_date, conversions=None, sdr_conversions=None,
+               windows=None, sdr_windows=None, day_stats=None):
+    """Payload dnia. day_stats: gotowe (ogółem, {owner: statystyki}), np. z arrays_day_stats()."""
+    day = to_day(report_date)
     by_owner = defaultdict(list)
     for d in today_deals:
-        by_owner[d["owner_name"]].append(d)
+        by_owner[d.owner_name].append(d)
 
-    total_stats = calc_stats(today_deals)
+    total_stats = day_stats[0] if day_stats else calc_stats(today_deals, day)
 
     # Lost reasons
-    all_lost = [d for d in today_deals if "Sales Lost" in d["stage_changes"] or "Lost Before MQL" in d["stage_changes"]]
+    all_lost = [d for d in today_deals if d.is_lost_on(day)]
     reason_counts = defaultdict(int)
     for d in all_lost:
-        reason_counts[d["lost_reason"] or "Brak powodu"] += 1
+        reason_counts[d.lost_reason or "Brak powodu"] += 1
     sorted_reasons = sorted(reason_counts.items(), key=lambda x: -x[1])
 
     # SDR data
     sdr_data = []
     for owner_name in sorted(by_owner.keys(), key=lambda x: -len(by_owner[x])):
         deals = by_owner[owner_name]
-        stats = calc_stats(deals)
-        lost_deals = [d for d in deals if "Sales Lost" in d["stage_changes"] or "Lost Before MQL" in d["stage_changes"]]
+        stats = day_stats[1][owner_name] if day_stats else calc_stats(deals, day)
 
         sdr_deals = []
+        sdr_lost = []
         for d in deals:
             sdr_deals.append({
-                "name": d["name"],
-                "current_stage": d["current_stage"],
-                "stage_changes": list(d["stage_changes"].keys()),
-            })
-
-        sdr_lost = []
-        for d in lost_deals:
-            lost_type = "Sales Lost" if "Sales Lost" in d["stage_changes"] else "Lost Before MQL"
-            sdr_lost.append({
-                "name": d["name"],
-                "lost_type": lost_type,
-                "lost_reason": d["lost_reason"] or "Brak powodu",
-                "lost_description": d["lost_description"],
+                "name": d.name,
+                "current_stage": d.current_stage,
+                "stage_changes": d.stage_changes(day),
             })
+            if d.is_lost_on(day):
+                sdr_lost.append({
+                    "name": d.name,
+                    "lost_type": "Sales Lost" if d.entered[SALES_LOST] == day else "Lost Before MQL",
+                    "lost_reason": d.lost_reason or "Brak powodu",
+                    "lost_description": d.lost_description,
+                })
 
         sdr_entry = {
             "name": owner_name,
@@ -323,6 +478,8 @@ def build_json(today_deals, report_date, conversions=None, sdr_conversions=None)
         }
         if sdr_conversions and owner_name in sdr_conversions:
             sdr_entry["conversions"] = sdr_conversions[owner_name]
+        if sdr_windows and owner_name in sdr_windows:
+            sdr_entry["conversion_windows"] = sdr_windows[owner_name]
 
         sdr_data.append(sdr_entry)
 
@@ -333,62 +490,128 @@ def build_json(today_deals, report_date, conversions=None, sdr_conversions=None)
         "active_sdrs": len(by_owner),
         "sdr_data": sdr_data,
         "lost_reasons": [{"reason": r, "count": c} for r, c in sorted_reasons],
+        "deal_index": build_deal_index(sdr_data),
     }
     if conversions:
         result["conversions"] = conversions
+    if windows:
+        result["conversion_windows"] = windows
 
     return result
 
 
-def update_index(data_dir, report_date):
-    index_path = os.path.join(data_dir, "index.json")
-    if os.path.exists(index_path):
-        with open(index_path, "r", encoding="utf-8") as f:
-            index = json.load(f)
-    else:
-        index = {"dates": []}
-
-    if report_date not in index["dates"]:
-        index["dates"].append(report_date)
-        index["dates"].sort()
-
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
+def payload_from_history(store, report_date):
+    """Odtwarza payload build_json dnia z HistoryStore (do publikacji jako JSON).
 
-    print(f"Index zaktualizowany: {len(index['dates'])} dat")
+    Statystyki pochodzą z daily_stats, deale ze stanu zapisanego w tym dniu.
+    None, gdy dnia nie ma w bazie albo nie da się go odtworzyć (starszy format).
+    """
+    loaded = store.load_day(report_date)
+    if loaded is None:
+        return None
+    generated_at, rows, stats, conv_counts = loaded
+    day = to_day(report_date)
+    today_deals = [
+        Deal(id=deal_id, name=name, current_stage=stage, owner_name=owner,
+             entered=tuple(day if i in stages else 0 for i in range(len(STAGE_ORDER))),
+             lost_reason=lost_reason or "", lost_description=lost_description or "")
+        for deal_id, name, owner, stage, lost_reason, lost_description, stages in rows
+    ]
+    day_stats = {owner: {**s, "lost_total": s["lost_before_mql"] + s["sales_lost"]} for owner, s in stats.items()}
+    overall = day_stats.pop("", None) or calc_stats([], day)
+
+    conversions = None
+    windows = {}
+    sdr_conversions = {}
+    sdr_windows = defaultdict(dict)
+    for (owner, period), counts in conv_counts.items():
+        conv = conv_metrics_from_counts(*counts)
+        if owner == "" and period == "ytd":
+            conversions = conv
+        elif owner == "":
+            windows[period] = conv
+        elif period == "ytd":
+            sdr_conversions[owner] = conv
+        else:
+            sdr_windows[owner][period] = conv
+
+    data = build_json(today_deals, report_date, conversions, sdr_conversions, windows, sdr_windows,
+                      (overall, day_stats))
+    data["generated_at"] = generated_at
+    return data
 
 
 def main():
+    instrumentation.start_profiling()
     report_date = get_report_date()
+    instrumentation.set_meta(script="generate_data", report_date=report_date)
     print(f"Generowanie danych dla daty: {report_date}")
 
-    owners = get_owners()
+    with instrumentation.stage("fetch"):
+        owners, all_deals = asyncio.run(fetch_owners_and_deals())
     print(f"Ownerzy: {len(owners)}")
-
-    all_deals = fetch_all_pipeline_deals()
-    print(f"Pobrano {len(all_deals)} deali z pipeline")
-
-    today_deals = process_deals(all_deals, owners, report_date)
+    print(f"Deali w pipeline: {len(all_deals)}")
+    instrumentation.incr("deals_scanned", len(all_deals))
+
+    with instrumentation.stage("normalize"):
+        deals = normalize_deals(all_deals, owners)
+    # Backend NumPy (jeśli dostępny): jedna macierz etapów zamiast pętli po dealach
+    arrays = None
+    with instrumentation.stage("process"):
+        if numpy_enabled():
+            arrays = build_deal_arrays(deals)
+            today_deals = [deals[i] for i in arrays.active(to_day(report_date))]
+        else:
+            today_deals = process_deals(deals, report_date)
+    instrumentation.set_meta(backend="numpy" if arrays is not None else "python")
     print(f"Deale ze zmiana etapu w {report_date}: {len(today_deals)}")
+    instrumentation.incr("deals_active", len(today_deals))
+
+    lost_today = [d for d in today_deals if d.is_lost_on(to_day(report_date))]
+    with instrumentation.stage("fetch_lost_descriptions"):
+        asyncio.run(fetch_lost_descriptions(lost_today))
 
     year_start = report_date[:4] + "-01-01"
-    conversions, sdr_conversions = calc_conversions(all_deals, owners, as_of_date=report_date, from_date=year_start)
+    with instrumentation.stage("conversions"):
+        index = arrays if arrays is not None else build_conversion_index(deals)
+        conversions, sdr_conversions = indexed_conversions(index, report_date, year_start)
+        windows, sdr_windows = conversion_windows(index, report_date)
     print(f"Konwersje {report_date[:4]}: Lead->MQL {conversions['lead_mql']}, MQL->SQL {conversions['mql_sql']}")
 
-    data = build_json(today_deals, report_date, conversions, sdr_conversions)
+    with instrumentation.stage("build_json"):
+        day_stats = arrays_day_stats(arrays, to_day(report_date)) if arrays is not None else None
+        data = build_json(today_deals, report_date, conversions, sdr_conversions, windows, sdr_windows, day_stats)
+
+    # Opcjonalna baza historii - JSON do publikacji odtwarzany z bazy
+    if os.getenv("HISTORY_DB"):
+        with instrumentation.stage("history"), HistoryStore(os.getenv("HISTORY_DB")) as store:
+            store.record_day(data, today_deals)
+            data = payload_from_history(store, report_date)
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(script_dir, "data")
     os.makedirs(data_dir, exist_ok=True)
 
-    # Save daily JSON
+    # Save daily JSON (+ index), pomijane gdy treść dnia się nie zmieniła
     json_path = os.path.join(data_dir, f"{report_date}.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"JSON zapisany: {json_path}")
-
-    # Update index
-    update_index(data_dir, report_date)
+    with instrumentation.stage("write"):
+        with OutputBatch(data_dir) as output:
+            written = output.add(report_date, data)
+
+        # Zestawienia tygodnia i miesiąca z tym dniem
+        if written:
+            write_rollups(data_dir, [report_date])
+    instrumentation.incr("days_written" if written else "days_unchanged")
+    print(f"JSON zapisany: {json_path}" if written else f"JSON bez zmian: {json_path}")
+
+    # Statyczny snapshot HTML z tego samego payloadu - bez drugiego pobierania z API
+    html_path = snapshot_path(data_dir, report_date)
+    if os.getenv("HTML_SNAPSHOT", "1") != "0" and (written or not os.path.exists(html_path)):
+        with instrumentation.stage("html_snapshot"):
+            write_html(html_path, data)
+        print(f"Snapshot HTML zapisany: {html_path}")
+
+    instrumentation.write_report(os.path.join(data_dir, "run_report.json"))
 
 
 if __name__ == "__main__":
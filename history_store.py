@@ -0,0 +1,232 @@
+"""
+Historia dashboardu w jednym pliku SQLite.
+
+Zamiast czytać dziesiątki plików data/YYYY-MM-DD.json, zapytania o zakres
+dat czytają tylko potrzebne kolumny z tabel:
+  day_deals          - deale aktywne w dniu ze stanem z chwili zapisu (nazwa,
+                       owner, etap, lost, indeksy etapów, w które weszły tego dnia),
+  days               - wygenerowane dni (generated_at),
+  daily_stats        - aktywność dnia, ogółem (owner = '') i per SDR,
+  daily_conversions  - liczniki konwersji dnia per okno (ytd / 30d / qtd).
+
+Pliki JSON do publikacji odtwarza z bazy generate_data.payload_from_history():
+statystyki z daily_stats, deale z day_deals - późniejsze dni i ponowne wejścia
+w etap nie zmieniają już zapisanego dnia. Dni zapisane starszą wersją (bez
+day_deals) nie są eksportowane - trzeba je zapisać ponownie (backfill.py).
+Włączane zmienną HISTORY_DB (ścieżka do pliku bazy).
+
+Użycie (eksport dni z bazy do JSON):
+  python history_store.py history.db --from 2026-02-01 --to 2026-02-28
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import date
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS day_deals (
+    day INTEGER,
+    deal_id TEXT,
+    name TEXT,
+    owner TEXT,
+    current_stage TEXT,
+    lost_reason TEXT,
+    lost_description TEXT,
+    stages TEXT,
+    PRIMARY KEY (day, deal_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS days (
+    day INTEGER PRIMARY KEY,
+    generated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day INTEGER,
+    owner TEXT,
+    total INTEGER,
+    new_lead INTEGER,
+    mql INTEGER,
+    sql INTEGER,
+    won INTEGER,
+    lost_before_mql INTEGER,
+    sales_lost INTEGER,
+    PRIMARY KEY (day, owner)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_conversions (
+    day INTEGER,
+    owner TEXT,
+    period TEXT,
+    total_leads INTEGER,
+    total_mql INTEGER,
+    lead_to_mql INTEGER,
+    mql_to_sql INTEGER,
+    lead_to_sql INTEGER,
+    PRIMARY KEY (day, owner, period)
+) WITHOUT ROWID;
+"""
+
+STAT_COLUMNS = ["total", "new_lead", "mql", "sql", "won", "lost_before_mql", "sales_lost"]
+CONV_COLUMNS = ["total_leads", "total_mql", "lead_to_mql", "mql_to_sql", "lead_to_sql"]
+OVERALL = ""
+
+
+def conv_counts(conv):
+    """Liczniki z bloku konwersji JSON (format conv_metrics_from_counts)."""
+    return (conv["total_leads"], conv["total_mql"], conv["lead_mql_num"], conv["mql_sql_num"], conv["lead_sql_num"])
+
+
+class HistoryStore:
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def record_day(self, payload, today_deals):
+        """Zapisuje dzień: deale aktywne w dniu (Deal), ich zdarzenia i agregaty z payloadu build_json."""
+        day = date.fromisoformat(payload["date"]).toordinal()
+        db = self.db
+
+        db.execute("DELETE FROM day_deals WHERE day = ?", (day,))
+        db.executemany(
+            "INSERT INTO day_deals VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(day, d.id, d.name, d.owner_name, d.current_stage, d.lost_reason, d.lost_description,
+              ",".join(str(i) for i, entered in enumerate(d.entered) if entered == day))
+             for d in today_deals],
+        )
+
+        db.execute("INSERT OR REPLACE INTO days VALUES (?, ?)", (day, payload["generated_at"]))
+
+        db.execute("DELETE FROM daily_stats WHERE day = ?", (day,))
+        stats_rows = [(day, OVERALL, *(payload["summary"][c] for c in STAT_COLUMNS))]
+        stats_rows += [(day, sdr["name"], *(sdr["stats"][c] for c in STAT_COLUMNS)) for sdr in payload["sdr_data"]]
+        db.executemany(f"INSERT INTO daily_stats VALUES ({', '.join('?' * (2 + len(STAT_COLUMNS)))})", stats_rows)
+
+        db.execute("DELETE FROM daily_conversions WHERE day = ?", (day,))
+        conv_rows = []
+        if payload.get("conversions"):
+            conv_rows.append((day, OVERALL, "ytd", *conv_counts(payload["conversions"])))
+        for period, conv in (payload.get("conversion_windows") or {}).items():
+            conv_rows.append((day, OVERALL, period, *conv_counts(conv)))
+        for sdr in payload["sdr_data"]:
+            if sdr.get("conversions"):
+                conv_rows.append((day, sdr["name"], "ytd", *conv_counts(sdr["conversions"])))
+            for period, conv in (sdr.get("conversion_windows") or {}).items():
+                conv_rows.append((day, sdr["name"], period, *conv_counts(conv)))
+        db.executemany(f"INSERT INTO daily_conversions VALUES ({', '.join('?' * (3 + len(CONV_COLUMNS)))})", conv_rows)
+
+    def dates(self):
+        return [date.fromordinal(d).isoformat() for (d,) in self.db.execute("SELECT day FROM days ORDER BY day")]
+
+    def load_day(self, report_date):
+        """Zwraca (generated_at, deale, statystyki, konwersje) dla dnia albo None.
+
+        deale: [(id, name, owner, current_stage, lost_reason, lost_description, [indeksy etapów dnia])]
+        statystyki: {owner: {kolumna: wartość}}, ogółem pod owner = ''
+        konwersje: {(owner, period): liczniki}
+        None także dla dnia z aktywnością, ale bez zapisanych deali (starszy format bazy).
+        """
+        day = date.fromisoformat(report_date).toordinal()
+        row = self.db.execute("SELECT generated_at FROM days WHERE day = ?", (day,)).fetchone()
+        if row is None:
+            return None
+
+        deals = [
+            (*deal_row, [int(i) for i in stages.split(",") if i])
+            for *deal_row, stages in self.db.execute(
+                "SELECT deal_id, name, owner, current_stage, lost_reason, lost_description, stages "
+                "FROM day_deals WHERE day = ? ORDER BY CAST(deal_id AS INTEGER), deal_id", (day,)
+            )
+        ]
+        stats = {
+            owner: dict(zip(STAT_COLUMNS, values))
+            for owner, *values in self.db.execute(
+                f"SELECT owner, {', '.join(STAT_COLUMNS)} FROM daily_stats WHERE day = ?", (day,)
+            )
+        }
+        if not deals and stats.get(OVERALL, {}).get("total"):
+            return None
+
+        conversions = {
+            (owner, period): tuple(counts)
+            for owner, period, *counts in self.db.execute(
+                f"SELECT owner, period, {', '.join(CONV_COLUMNS)} FROM daily_conversions WHERE day = ?", (day,)
+            )
+        }
+        return row[0], deals, stats, conversions
+
+    def range_stats(self, from_date, to_date, columns=("total",), owner=OVERALL):
+        """Agregaty dzienne z zakresu dat - czyta tylko wskazane kolumny.
+
+        owner=None zwraca wiersze wszystkich SDR-ów (bez wiersza ogółem).
+        """
+        unknown = set(columns) - set(STAT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Nieznane kolumny: {sorted(unknown)}")
+        query = f"SELECT day, owner, {', '.join(columns)} FROM daily_stats WHERE day BETWEEN ? AND ?"
+        params = [date.fromisoformat(from_date).toordinal(), date.fromisoformat(to_date).toordinal()]
+        if owner is None:
+            query += " AND owner != ''"
+        else:
+            query += " AND owner = ?"
+            params.append(owner)
+        return [
+            (date.fromordinal(day).isoformat(), row_owner, *values)
+            for day, row_owner, *values in self.db.execute(query + " ORDER BY day", params)
+        ]
+
+    def range_conversions(self, from_date, to_date, period="ytd", owner=OVERALL):
+        query = (f"SELECT day, {', '.join(CONV_COLUMNS)} FROM daily_conversions "
+                 "WHERE day BETWEEN ? AND ? AND period = ? AND owner = ? ORDER BY day")
+        params = (date.fromisoformat(from_date).toordinal(), date.fromisoformat(to_date).toordinal(), period, owner)
+        return [(date.fromordinal(day).isoformat(), *counts) for day, *counts in self.db.execute(query, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eksport dni z bazy historii do plików JSON")
+    parser.add_argument("db", help="plik bazy SQLite (HISTORY_DB)")
+    parser.add_argument("--from", dest="from_date", help="pierwszy dzień (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_date", help="ostatni dzień (YYYY-MM-DD)")
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from generate_data import payload_from_history
+    from output_writer import OutputBatch
+    from rollups import write_rollups
+
+    with HistoryStore(args.db) as store:
+        dates = [d for d in store.dates()
+                 if (not args.from_date or d >= args.from_date) and (not args.to_date or d <= args.to_date)]
+        missing = []
+        with OutputBatch(args.data_dir) as output:
+            for report_date in dates:
+                data = payload_from_history(store, report_date)
+                if data is None:
+                    missing.append(report_date)
+                    continue
+                output.add(report_date, data)
+    write_rollups(args.data_dir, output.dates)
+    print(f"Wyeksportowano {len(output.dates)} dni z {args.db} ({len(output.skipped)} bez zmian)")
+    if missing:
+        print(f"Pominięto {len(missing)} dni bez zapisanych deali (starszy format bazy): "
+              f"{missing[0]} .. {missing[-1]} - zapisz je ponownie backfill.py")
+
+
+if __name__ == "__main__":
+    main()
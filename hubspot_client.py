@@ -0,0 +1,387 @@
+"""
+Asynchroniczny klient HubSpot CRM API.
+
+Jedna sesja HTTP z pulą połączeń, wspólny token bucket pilnujący limitów
+HubSpot (ogólny na sekundę, osobny dla endpointów search i dzienny) oraz
+retry z backoffem i jitterem (Retry-After dla 429).
+
+HUBSPOT_BASE_URL pozwala skierować klienta na lokalny serwer zastępczy
+(replay_server.py), a HUBSPOT_RECORD_DIR zapisuje odpowiedzi jako fixture'y
+do późniejszego odtworzenia.
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import contextlib
+from urllib.parse import quote
+
+import aiohttp
+
+import instrumentation
+
+DEFAULT_BASE_URL = "https://api.hubapi.com"
+
+# Limity HubSpot: 100 req / 10 s (Starter), search 5 req/s, 250k req / dzień.
+RATE_PER_SECOND = float(os.getenv("HUBSPOT_RATE_PER_SECOND", "9"))
+SEARCH_RATE_PER_SECOND = float(os.getenv("HUBSPOT_SEARCH_RATE_PER_SECOND", "4"))
+DAILY_LIMIT = int(os.getenv("HUBSPOT_DAILY_LIMIT", "250000"))
+
+MAX_ATTEMPTS = 8
+# Search API nie stronicuje dalej niż 10 000 wyników na zapytanie.
+SEARCH_RESULT_LIMIT = 10000
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HubSpotError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f"HubSpot API error {status}: {message}")
+        self.status = status
+
+
+def fixture_key(method, path, body=None):
+    """Klucz fixture'a: hash metody, ścieżki (z query) i kanonicznego body."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":")) if body is not None else ""
+    raw = f"{method.upper()} {path}\n{canonical}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def save_fixture(record_dir, method, path, body, response):
+    os.makedirs(record_dir, exist_ok=True)
+    fixture = {"method": method.upper(), "path": path, "body": body, "response": response}
+    with open(os.path.join(record_dir, fixture_key(method, path, body) + ".json"), "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False)
+
+
+class TokenBucket:
+    """Token bucket dla asyncio. acquire() czeka, aż będzie wolny token."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def block(self, seconds):
+        """Wstrzymuje wszystkich korzystających z bucketa (np. po 429)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Pobiera token. Zwraca czas oczekiwania w sekundach."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Czas oczekiwania przed kolejną próbą (z jitterem)."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, max(1.0, retry_after * 0.25))
+    return min(2 ** attempt, 60) * random.uniform(0.5, 1.5)
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class HubSpotClient:
+    """Klient HubSpot do użycia jako `async with HubSpotClient() as client`."""
+
+    def __init__(self, token=None, base_url=None, rate_per_second=RATE_PER_SECOND,
+                 search_rate_per_second=SEARCH_RATE_PER_SECOND, daily_limit=DAILY_LIMIT,
+                 max_connections=10, timeout=60, max_attempts=MAX_ATTEMPTS, record_dir=None):
+        self.token = token if token is not None else os.getenv("HUBSPOT_API_TOKEN")
+        self.base_url = (base_url or os.getenv("HUBSPOT_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.bucket = TokenBucket(rate_per_second)
+        self.search_bucket = TokenBucket(search_rate_per_second)
+        self.daily_limit = daily_limit
+        self.daily_remaining = None
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.requests_made = 0
+        self.record_dir = record_dir or os.getenv("HUBSPOT_RECORD_DIR")
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bearer {self.token}"},
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    def _check_daily_limit(self):
+        if self.requests_made >= self.daily_limit or self.daily_remaining == 0:
+            raise HubSpotError(429, "wyczerpany dzienny limit zapytań")
+
+    async def request(self, method, path, payload=None, search=False):
+        """Wysyła zapytanie z limitowaniem i retry. Zwraca zdekodowany JSON."""
+        url = self.base_url + path
+        status = 0
+        for attempt in range(self.max_attempts):
+            self._check_daily_limit()
+            waited = await self.search_bucket.acquire() if search else 0.0
+            waited += await self.bucket.acquire()
+            if waited:
+                instrumentation.incr("rate_limit_waits")
+                instrumentation.incr("rate_limit_wait_s", waited)
+            self.requests_made += 1
+            instrumentation.incr("api_calls")
+
+            try:
+                with instrumentation.stage("api_search" if search else "api_request"):
+                    async with self.session.request(method, url, json=payload) as r:
+                        remaining = r.headers.get("X-HubSpot-RateLimit-Daily-Remaining")
+                        if remaining is not None and remaining.isdigit():
+                            self.daily_remaining = int(remaining)
+                        status = r.status
+                        raw = await r.read()
+                        retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                instrumentation.incr("bytes_received", len(raw))
+                # 207 - batch z częścią nieznalezionych rekordów (wyniki i tak są w "results")
+                if status in (200, 207):
+                    data = json.loads(raw)
+                    if self.record_dir:
+                        save_fixture(self.record_dir, method, path, payload, data)
+                    return data
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                delay = backoff_delay(attempt)
+                print(f"  {type(e).__name__} - czekam {delay:.1f}s (próba {attempt+1}/{self.max_attempts})...")
+                instrumentation.incr("retries")
+                instrumentation.incr("retry_wait_s", delay)
+                await asyncio.sleep(delay)
+                continue
+
+            if status not in RETRY_STATUSES:
+                raise HubSpotError(status, raw[:500].decode("utf-8", "replace"))
+
+            delay = backoff_delay(attempt, retry_after if status == 429 else None)
+            if status == 429:
+                (self.search_bucket if search else self.bucket).block(delay)
+                instrumentation.incr("rate_limited_responses")
+                print(f"  Rate limit - czekam {delay:.1f}s (próba {attempt+1}/{self.max_attempts})...")
+            else:
+                print(f"  HTTP {status} - czekam {delay:.1f}s (próba {attempt+1}/{self.max_attempts})...")
+            instrumentation.incr("retries")
+            instrumentation.incr("retry_wait_s", delay)
+            await asyncio.sleep(delay)
+
+        raise HubSpotError(status, "przekroczona liczba prób")
+
+    async def get_owners(self, limit=200):
+        """Wszyscy ownerzy {id: imię nazwisko} - kolejne strony przez paging.next.after."""
+        owners = {}
+        after = None
+        while True:
+            path = f"/crm/v3/owners?limit={limit}" + (f"&after={quote(after)}" if after else "")
+            data = await self.request("GET", path)
+            for o in data.get("results", []):
+                owners[o["id"]] = f"{o.get('firstName', '')} {o.get('lastName', '')}".strip()
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return owners
+
+    async def batch_read(self, object_type, ids, properties, batch_size=100):
+        """Rekordy po id przez /crm/v3/objects/{object_type}/batch/read - paczki po batch_size, równolegle."""
+        path = f"/crm/v3/objects/{object_type}/batch/read"
+        ids = list(ids)
+        pages = await asyncio.gather(*(
+            self.request("POST", path, payload={
+                "properties": properties,
+                "inputs": [{"id": deal_id} for deal_id in ids[i:i + batch_size]],
+            })
+            for i in range(0, len(ids), batch_size)
+        ))
+        return [result for page in pages for result in page.get("results", [])]
+
+    async def search_pages(self, object_type, payload, first_page=None):
+        """Async generator stron wyników /crm/v3/objects/{object_type}/search.
+
+        first_page: już pobrana pierwsza strona (żeby nie pytać o nią drugi raz).
+        """
+        payload = dict(payload)
+        path = f"/crm/v3/objects/{object_type}/search"
+        data = first_page
+        while True:
+            if data is None:
+                data = await self.request("POST", path, payload=payload, search=True)
+            yield data
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                break
+            payload["after"] = after
+            data = None
+
+    async def search_all(self, object_type, payload, first_page=None, checkpoint=None, key="all"):
+        """Wszystkie wyniki zapytania. Z checkpointem (SearchCheckpoint) każda strona
+        jest zapisywana pod `key`, a zapytanie przerwane wcześniej wznawia od ostatniej strony."""
+        results = []
+
+        async def collect(page_results):
+            results.extend(page_results)
+
+        await self._emit_pages(object_type, payload, first_page, checkpoint, key, collect)
+        return results
+
+    async def _emit_pages(self, object_type, payload, first_page, checkpoint, key, emit):
+        """Przekazuje wyniki kolejnych stron do `await emit(wyniki)`."""
+        state = checkpoint.progress(key) if checkpoint is not None else None
+        if state is not None:
+            saved, after = state
+            checkpoint.release(key)
+            if saved:
+                await emit(saved)
+            if after is None:
+                return
+            payload, first_page = dict(payload, after=after), None
+        async for page in self.search_pages(object_type, payload, first_page):
+            page_results = page.get("results", [])
+            if checkpoint is not None:
+                checkpoint.record_page(key, page_results, page.get("paging", {}).get("next", {}).get("after"))
+            await emit(page_results)
+
+    async def search_partitioned(self, object_type, payload, id_property="hs_object_id",
+                                 max_results=SEARCH_RESULT_LIMIT, checkpoint=None):
+        """Jak search_all, ale omija limit 10k wyników search API.
+
+        Gdy zapytanie zwraca więcej niż max_results, dzieli je na zakresy
+        id_property, pobiera zakresy równolegle (dzieląc dalej te, które
+        nadal są za duże) i scala wyniki bez duplikatów, posortowane po id.
+
+        checkpoint (SearchCheckpoint): zapisuje podział i każdą stronę, przy
+        wznowieniu pomija pobrane zakresy i kontynuuje od ostatniej strony.
+        """
+        results = []
+        async for page_results in self.iter_partitioned(object_type, payload, id_property, max_results, checkpoint):
+            results.extend(page_results)
+        results.sort(key=lambda r: int(r["id"]))
+        return results
+
+    async def iter_partitioned(self, object_type, payload, id_property="hs_object_id",
+                               max_results=SEARCH_RESULT_LIMIT, checkpoint=None):
+        """Async generator wyników search_partitioned, strona po stronie, bez duplikatów.
+
+        Zakresy pobierane są w tle, a strony oddawane w kolejności nadejścia
+        (nie po id) - konsument przetwarza stronę, gdy kolejne są w drodze.
+        """
+        queue = asyncio.Queue()
+
+        async def emit(page_results):
+            queue.put_nowait(page_results)
+
+        async def produce():
+            try:
+                await self._partitioned(object_type, payload, id_property, max_results, checkpoint, emit)
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(produce())
+        seen = set()
+        try:
+            while True:
+                page_results = await queue.get()
+                if page_results is None:
+                    break
+                fresh = [r for r in page_results if r["id"] not in seen]
+                seen.update(r["id"] for r in fresh)
+                yield fresh
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+    async def _partitioned(self, object_type, payload, id_property, max_results, checkpoint, emit):
+        path = f"/crm/v3/objects/{object_type}/search"
+        payload = sorted_by_id(payload, id_property)
+        if checkpoint is not None and checkpoint.progress("all") is not None:
+            return await self._emit_pages(object_type, payload, None, checkpoint, "all", emit)
+
+        ranges = checkpoint.plan if checkpoint is not None else None
+        if ranges is None:
+            first = await self.request("POST", path, payload=payload, search=True)
+            total = first.get("total", 0)
+            if total <= max_results:
+                return await self._emit_pages(object_type, payload, first, checkpoint, "all", emit)
+
+            lo = await self._id_bound(object_type, payload, id_property, "ASCENDING")
+            hi = await self._id_bound(object_type, payload, id_property, "DESCENDING")
+            parts = math.ceil(total / (max_results // 2))
+            step = max((hi - lo + 1) // parts, 1)
+            ranges = [(start, min(start + step - 1, hi)) for start in range(lo, hi + 1, step)]
+            print(f"  {total} wyników > {max_results} - dzielę na {len(ranges)} partycji {id_property}")
+            if checkpoint is not None:
+                checkpoint.set_plan(ranges)
+
+        await asyncio.gather(*(
+            self._search_range(object_type, payload, id_property, start, end, max_results, checkpoint, emit)
+            for start, end in ranges
+        ))
+
+    async def _id_bound(self, object_type, payload, id_property, direction):
+        probe = dict(payload, limit=1, sorts=[{"propertyName": id_property, "direction": direction}])
+        probe.pop("after", None)
+        data = await self.request("POST", f"/crm/v3/objects/{object_type}/search", payload=probe, search=True)
+        return int(data["results"][0]["id"])
+
+    async def _search_range(self, object_type, payload, id_property, start, end, max_results, checkpoint, emit):
+        ranged = with_id_range(payload, id_property, start, end)
+        key = f"{start}-{end}"
+        if checkpoint is not None and checkpoint.progress(key) is not None:
+            return await self._emit_pages(object_type, ranged, None, checkpoint, key, emit)
+        first = await self.request("POST", f"/crm/v3/objects/{object_type}/search", payload=ranged, search=True)
+        if first.get("total", 0) <= max_results or start >= end:
+            return await self._emit_pages(object_type, ranged, first, checkpoint, key, emit)
+        mid = (start + end) // 2
+        await asyncio.gather(
+            self._search_range(object_type, payload, id_property, start, mid, max_results, checkpoint, emit),
+            self._search_range(object_type, payload, id_property, mid + 1, end, max_results, checkpoint, emit),
+        )
+
+
+def sorted_by_id(payload, id_property):
+    """Stabilne sortowanie po id - stronicowanie nie gubi rekordów zmienianych w trakcie."""
+    return dict(payload, sorts=[{"propertyName": id_property, "direction": "ASCENDING"}])
+
+
+def with_id_range(payload, id_property, start, end):
+    """Dokłada do każdej grupy filtrów warunek start <= id_property <= end."""
+    range_filters = [
+        {"propertyName": id_property, "operator": "GTE", "value": str(start)},
+        {"propertyName": id_property, "operator": "LTE", "value": str(end)},
+    ]
+    groups = payload.get("filterGroups") or [{"filters": []}]
+    return dict(payload, filterGroups=[
+        dict(group, filters=group.get("filters", []) + range_filters) for group in groups
+    ])
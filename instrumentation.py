@@ -0,0 +1,125 @@
+"""
+Pomiary czasu etapów i liczniki dla jednego uruchomienia skryptu.
+
+Moduł trzyma jeden raport na proces (`report`). Kod woła `stage("nazwa")`
+jako context manager oraz `incr("licznik", n)`, a na końcu `write_report()`
+zapisuje JSON z czasami, licznikami i (opcjonalnie) wynikami profilowania.
+
+SDR_PROFILE=cprofile   zapisuje profil cProfile obok raportu (.prof),
+SDR_PROFILE=tracemalloc dopisuje do raportu największe miejsca alokacji.
+"""
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class RunReport:
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.meta = {}
+
+    def add_timing(self, name, seconds):
+        s = self.stages.get(name)
+        if s is None:
+            s = self.stages[name] = {"count": 0, "total_s": 0.0, "max_s": 0.0}
+        s["count"] += 1
+        s["total_s"] += seconds
+        s["max_s"] = max(s["max_s"], seconds)
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {
+            "started_at": self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_s": round(time.perf_counter() - self.start, 3),
+            **self.meta,
+            "stages": {
+                name: {"count": s["count"], "total_s": round(s["total_s"], 4), "max_s": round(s["max_s"], 4)}
+                for name, s in self.stages.items()
+            },
+            "counters": {
+                name: round(v, 3) if isinstance(v, float) else v for name, v in self.counters.items()
+            },
+        }
+
+
+report = RunReport()
+_profiler = None
+
+
+def reset():
+    global report
+    report = RunReport()
+
+
+@contextmanager
+def stage(name):
+    """Mierzy czas bloku i dolicza go do etapu `name` (etapy mogą się powtarzać)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.add_timing(name, time.perf_counter() - start)
+
+
+async def timed(name, awaitable):
+    """Jak stage(), ale dla korutyny uruchamianej np. w asyncio.gather."""
+    with stage(name):
+        return await awaitable
+
+
+def incr(name, n=1):
+    report.incr(name, n)
+
+
+def set_meta(**kwargs):
+    report.meta.update(kwargs)
+
+
+def start_profiling():
+    """Włącza profilowanie wybrane przez SDR_PROFILE (cprofile / tracemalloc)."""
+    global _profiler
+    mode = os.getenv("SDR_PROFILE", "").lower()
+    if mode == "cprofile":
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif mode == "tracemalloc":
+        tracemalloc.start(10)
+
+
+def write_report(path, top_allocations=15):
+    """Zapisuje raport JSON (i ewentualny profil) pod `path`."""
+    global _profiler
+    data = report.as_dict()
+
+    if _profiler is not None:
+        _profiler.disable()
+        prof_path = os.path.splitext(path)[0] + ".prof"
+        _profiler.dump_stats(prof_path)
+        data["profile"] = prof_path
+        _profiler = None
+
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        data["tracemalloc"] = {
+            "peak_mb": round(peak / (1024 * 1024), 2),
+            "top": [
+                {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top_allocations]
+            ],
+        }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
@@ -0,0 +1,84 @@
+"""
+Opcjonalny backend NumPy dla statystyk dnia i konwersji.
+
+Dni wejścia w etapy trzymane są jako macierz (N deali x 8 etapów, int32,
+ordinale, 0 = brak etapu) plus wektor indeksów ownerów. Aktywność dnia,
+rozbicie per SDR i liczniki konwersji liczone są maskami i np.bincount
+zamiast pętli po dealach w Pythonie.
+
+DealArrays ma ten sam interfejs co ConversionIndex (owners, counts()),
+więc indexed_conversions() i conversion_windows() działają na obu.
+Moduł importuje numpy na górze - brak pakietu = ImportError, a
+generate_data wraca wtedy do czystego Pythona (SDR_BACKEND).
+"""
+from itertools import chain
+
+import numpy as np
+
+
+class DealArrays:
+    """Macierz dni wejścia w etapy dla listy Deal (kolejność jak w liście).
+
+    nl, mql, sql: indeksy kolumn New Lead, MQL i SQL (jak w Deal.entered).
+    """
+
+    def __init__(self, deals, stage_count, nl, mql, sql):
+        owner_ids = {}
+        self.owner_idx = np.fromiter(
+            (owner_ids.setdefault(d.owner_name, len(owner_ids)) for d in deals), dtype=np.int32, count=len(deals))
+        self._owners = list(owner_ids)
+        self._owner_pos = owner_ids
+        self.entered = np.fromiter(
+            chain.from_iterable(d.entered for d in deals), dtype=np.int32, count=len(deals) * stage_count,
+        ).reshape(len(deals), stage_count)
+        self.nl, self.mql, self.sql = nl, mql, sql
+        self._last_counts = None
+
+    @property
+    def owners(self):
+        return list(self._owners)
+
+    def _bincount(self, mask):
+        return np.bincount(self.owner_idx[mask], minlength=len(self._owners))
+
+    def active(self, day):
+        """Indeksy deali, które tego dnia weszły w jakikolwiek etap (rosnąco)."""
+        return np.flatnonzero((self.entered == day).any(axis=1))
+
+    def day_counts(self, day):
+        """Aktywność dnia per owner: (owner -> liczba aktywnych deali, owner -> liczniki wejść per etap)."""
+        rows = self.active(day)
+        hits = self.entered[rows] == day
+        owners = self.owner_idx[rows]
+        size = len(self._owners)
+        totals = np.bincount(owners, minlength=size)
+        per_stage = np.stack([np.bincount(owners[hits[:, i]], minlength=size) for i in range(hits.shape[1])], axis=1)
+        return (
+            {owner: int(totals[k]) for owner, k in self._owner_pos.items() if totals[k]},
+            {owner: per_stage[k].tolist() for owner, k in self._owner_pos.items() if totals[k]},
+        )
+
+    def _window_counts(self, from_day, as_of_day):
+        """Liczniki konwersji okna per owner, macierz (ownerzy x 5); ostatni wynik jest zapamiętany."""
+        if self._last_counts and self._last_counts[0] == (from_day, as_of_day):
+            return self._last_counts[1]
+        e = self.entered
+        nl = e[:, self.nl]
+        leads = (nl >= from_day) & (nl <= as_of_day) & (nl > 0)
+        mql = leads & (e[:, self.mql] > 0) & (e[:, self.mql] <= as_of_day)
+        sql = leads & (e[:, self.sql] > 0) & (e[:, self.sql] <= as_of_day)
+        mql_count = self._bincount(mql)
+        counts = np.stack([self._bincount(leads), mql_count, mql_count, self._bincount(mql & sql), self._bincount(sql)],
+                          axis=1)
+        self._last_counts = ((from_day, as_of_day), counts)
+        return counts
+
+    def counts(self, from_day, as_of_day, owner=None):
+        """Jak ConversionIndex.counts: (total_leads, total_mql, lead_to_mql, mql_to_sql, lead_to_sql)."""
+        counts = self._window_counts(from_day, as_of_day)
+        if owner is None:
+            return tuple(int(c) for c in counts.sum(axis=0)) if len(counts) else (0, 0, 0, 0, 0)
+        k = self._owner_pos.get(owner)
+        if k is None:
+            return 0, 0, 0, 0, 0
+        return tuple(int(c) for c in counts[k])
@@ -0,0 +1,245 @@
+"""
+Zapis plików data/: atomowo (plik tymczasowy + os.replace) i w paczkach.
+
+Przerwany zapis nie zostawia uciętego JSON-a - dashboard widzi albo starą,
+albo nową wersję pliku. OutputBatch zbiera dni wygenerowane w backfillu,
+zapisuje je paczkami i aktualizuje index.json raz, na końcu.
+
+index.json trzyma też odcisk treści każdego dnia (bez generated_at). Dzień
+z niezmienionym odciskiem nie jest ponownie serializowany ani zapisywany,
+więc workflow nie commituje plików różniących się tylko znacznikiem czasu.
+
+Serializacja: domyślnie zwarty JSON (bez wcięć), przez orjson, jeśli jest
+zainstalowany, inaczej przez stdlib json - wynik jest ten sam.
+DATA_JSON_PRETTY=1 przywraca wcięcia. DATA_PRECOMPRESS=gzip,br zapisuje
+obok każdego pliku skompresowane kopie (.json.gz, .json.br) dla hostingu
+statycznego, który serwuje gotowe pliki (br wymaga pakietu brotli).
+
+Payload dnia / zestawienia publikowany jest jako dwa pliki: podsumowanie
+(data/<nazwa>.json - statystyki, konwersje, przyczyny lostów) i szczegóły
+(data/details/<nazwa>.json - listy deali per SDR i deal_index). Dashboard
+pobiera szczegóły dopiero przy otwarciu listy deali albo drill-downu.
+Podsumowanie wskazuje plik szczegółów kluczem "details"; load_payload()
+składa oba z powrotem w pełny payload build_json.
+"""
+import os
+import gzip
+import json
+import hashlib
+
+from deal_index import build_deal_index
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PRETTY = os.getenv("DATA_JSON_PRETTY") == "1"
+PRECOMPRESS = [c.strip() for c in os.getenv("DATA_PRECOMPRESS", "").split(",") if c.strip()]
+COMPRESSORS = {
+    "gzip": (".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0)),
+    "br": (".br", lambda raw: brotli.compress(raw, quality=11)),
+}
+
+
+def check_precompress():
+    for name in PRECOMPRESS:
+        if name not in COMPRESSORS:
+            raise RuntimeError(f"DATA_PRECOMPRESS: nieznany format '{name}' (dostępne: gzip, br)")
+        if name == "br" and brotli is None:
+            raise RuntimeError("DATA_PRECOMPRESS=br wymaga pakietu brotli (pip install brotli)")
+
+
+def write_bytes_atomic(path, raw):
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def dumps(data, pretty=None):
+    """Payload jako bajty UTF-8: zwarty JSON albo z wcięciami (DATA_JSON_PRETTY)."""
+    pretty = PRETTY if pretty is None else pretty
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def published_paths(path):
+    """Plik i jego skompresowane kopie wymagane przez DATA_PRECOMPRESS."""
+    return [path] + [path + COMPRESSORS[name][0] for name in PRECOMPRESS]
+
+
+def write_published(path, raw):
+    """Zapisuje plik i jego skompresowane kopie (DATA_PRECOMPRESS).
+
+    Kopie formatów spoza DATA_PRECOMPRESS są usuwane - hosting serwujący
+    gotowe pliki podawałby inaczej nieaktualną treść.
+    """
+    write_bytes_atomic(path, raw)
+    for name, (suffix, compress) in COMPRESSORS.items():
+        if name in PRECOMPRESS:
+            write_bytes_atomic(path + suffix, compress(raw))
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def write_json_atomic(path, data):
+    write_published(path, dumps(data))
+
+
+def fingerprint(data):
+    """Odcisk treści payloadu dnia - bez generated_at, niezależny od kolejności kluczy."""
+    content = {k: v for k, v in data.items() if k != "generated_at"}
+    if orjson is not None:
+        canonical = orjson.dumps(content, option=orjson.OPT_SORT_KEYS)
+    else:
+        canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+DETAIL_KEYS = ("deals", "lost_deals")
+
+
+def details_name(name):
+    return f"details/{name}.json"
+
+
+def split_payload(data, name):
+    """(podsumowanie, szczegóły) payloadu; name to ścieżka względem data/ bez .json."""
+    summary = {k: v for k, v in data.items() if k != "deal_index"}
+    summary["sdr_data"] = [{k: v for k, v in sdr.items() if k not in DETAIL_KEYS} for sdr in data["sdr_data"]]
+    summary["details"] = details_name(name)
+    details = {
+        "date": data["date"],
+        "sdr_data": [{"name": sdr["name"], "deals": sdr["deals"], "lost_deals": sdr["lost_deals"]}
+                     for sdr in data["sdr_data"]],
+        "deal_index": data.get("deal_index") or build_deal_index(data["sdr_data"]),
+    }
+    return summary, details
+
+
+def merge_details(summary, details):
+    """Odwrotność split_payload - pełny payload z podsumowania i szczegółów."""
+    data = {k: v for k, v in summary.items() if k != "details"}
+    lists = {sdr["name"]: sdr for sdr in details["sdr_data"]}
+    data["sdr_data"] = [{**sdr, **{k: lists[sdr["name"]][k] for k in DETAIL_KEYS}} for sdr in summary["sdr_data"]]
+    data["deal_index"] = details["deal_index"]
+    return data
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_payload(data_dir, name):
+    """Pełny payload z data_dir/<name>.json (i pliku szczegółów, jeśli jest osobny)."""
+    summary = read_json(os.path.join(data_dir, f"{name}.json"))
+    if "details" not in summary:
+        return summary
+    return merge_details(summary, read_json(os.path.join(data_dir, summary["details"])))
+
+
+def dumps_payload(data, name):
+    """Serializuje payload jako (podsumowanie, szczegóły) - bajty do write_payload."""
+    summary, details = split_payload(data, name)
+    return dumps(summary), dumps(details)
+
+
+def write_payload(data_dir, name, raw):
+    """Zapisuje parę plików z dumps_payload; szczegóły najpierw, żeby podsumowanie nie wskazywało brakującego pliku."""
+    summary_raw, details_raw = raw
+    details_path = os.path.join(data_dir, details_name(name))
+    os.makedirs(os.path.dirname(details_path), exist_ok=True)
+    write_published(details_path, details_raw)
+    write_published(os.path.join(data_dir, f"{name}.json"), summary_raw)
+
+
+def load_index(data_dir):
+    index_path = os.path.join(data_dir, "index.json")
+    if os.path.exists(index_path):
+        return read_json(index_path)
+    return {"dates": []}
+
+
+def is_unchanged(data_dir, index, report_date, digest):
+    """Ten sam odcisk i komplet plików dnia, łącznie z kopiami z DATA_PRECOMPRESS."""
+    if index.get("fingerprints", {}).get(report_date) != digest:
+        return False
+    paths = (os.path.join(data_dir, f"{report_date}.json"), os.path.join(data_dir, details_name(report_date)))
+    return all(os.path.exists(p) for path in paths for p in published_paths(path))
+
+
+def update_index(data_dir, *report_dates, fingerprints=None):
+    """Dopisuje daty (i odciski dni) do data/index.json - jeden odczyt i jeden zapis."""
+    index = load_index(data_dir)
+    index["dates"] = sorted(set(index["dates"]).union(report_dates))
+    if fingerprints:
+        index["fingerprints"] = dict(sorted({**index.get("fingerprints", {}), **fingerprints}.items()))
+    write_json_atomic(os.path.join(data_dir, "index.json"), index)
+
+    print(f"Index zaktualizowany: {len(index['dates'])} dat")
+
+
+class OutputBatch:
+    """Bufor plików dni: zapis co batch_size dni, index.json raz przy zamknięciu.
+
+    Przy wyjątku dni już zbuforowane i tak są zapisywane i dopisywane do
+    indeksu - każdy z nich jest kompletny. Dni bez zmian (ten sam odcisk)
+    są pomijane; `dates` to dni faktycznie zapisane, `skipped` - pominięte.
+    """
+
+    def __init__(self, data_dir, batch_size=100):
+        self.data_dir = data_dir
+        self.batch_size = batch_size
+        self.pending = []
+        self.dates = []
+        self.skipped = []
+        self.fingerprints = {}
+        check_precompress()
+        os.makedirs(data_dir, exist_ok=True)
+        self.index = load_index(data_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, report_date, data):
+        """Dodaje dzień do zapisu. Zwraca False, gdy treść się nie zmieniła."""
+        digest = fingerprint(data)
+        if is_unchanged(self.data_dir, self.index, report_date, digest):
+            self.skipped.append(report_date)
+            return False
+        self.pending.append((report_date, digest, dumps_payload(data, report_date)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        for report_date, digest, raw in self.pending:
+            write_payload(self.data_dir, report_date, raw)
+            self.dates.append(report_date)
+            self.fingerprints[report_date] = digest
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.dates:
+            update_index(self.data_dir, *self.dates, fingerprints=self.fingerprints)
+        if self.skipped:
+            print(f"Bez zmian (pominięte): {len(self.skipped)} dni")
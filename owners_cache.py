@@ -0,0 +1,89 @@
+"""
+Cache ownerów HubSpot (id -> imię i nazwisko) z TTL.
+
+Lista ownerów zmienia się rzadko, więc zamiast pytać API przy każdym
+uruchomieniu trzymamy ją w cache/owners.json (OWNERS_CACHE_PATH).
+Odświeżenie następuje, gdy cache jest starszy niż OWNERS_CACHE_TTL_HOURS
+(domyślnie 24h) albo gdy deale odwołują się do ownera, którego w cache nie
+ma (nowa osoba w zespole). Id nieznalezione także po odświeżeniu są
+zapamiętywane (także przez kolejne odświeżenia po TTL), żeby nie odświeżać
+cache przy każdym uruchomieniu.
+"""
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+import instrumentation
+
+CACHE_VERSION = 1
+OWNERS_TTL = timedelta(hours=float(os.getenv("OWNERS_CACHE_TTL_HOURS", "24")))
+
+
+def default_cache_path():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.getenv("OWNERS_CACHE_PATH") or os.path.join(script_dir, "cache", "owners.json")
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cache if cache.get("version") == CACHE_VERSION else None
+
+
+def save_cache(path, owners, unknown_ids=()):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cache = {
+        "version": CACHE_VERSION,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+        "owners": owners,
+        "unknown_ids": sorted(unknown_ids),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def owner_ids(raw_deals):
+    """Id ownerów, do których odwołują się surowe deale HubSpot."""
+    return {d["properties"].get("hubspot_owner_id") for d in raw_deals} - {None, ""}
+
+
+def refresh_reason(cache, required_ids, ttl, now=None):
+    """Powód odświeżenia cache albo None, gdy cache jest aktualny."""
+    if cache is None:
+        return "brak cache"
+    now = now or datetime.now(timezone.utc)
+    if now - datetime.fromisoformat(cache["fetched_at"]) > ttl:
+        return "cache wygasł"
+    missing = set(required_ids) - set(cache["owners"]) - set(cache.get("unknown_ids", []))
+    if missing:
+        return f"{len(missing)} nowych ownerów"
+    return None
+
+
+async def get_owners(client, required_ids=(), path=None, ttl=OWNERS_TTL):
+    """Zwraca {id: nazwa} z cache, odświeżając go z API (wszystkie strony) tylko w razie potrzeby."""
+    path = path or default_cache_path()
+    cache = load_cache(path)
+    reason = refresh_reason(cache, required_ids, ttl)
+    if reason is None:
+        instrumentation.incr("owners_cache_hits")
+        return cache["owners"]
+
+    owners = await client.get_owners()
+    # Odświeżenie po TTL nie zna id z deali - zapamiętane nieznane id, których
+    # nadal nie ma na liście (dezaktywowani ownerzy), zostają w cache
+    previous = set(cache.get("unknown_ids", [])) if cache else set()
+    new_unknown = set(required_ids) - set(owners)
+    unknown = (previous | new_unknown) - set(owners)
+    save_cache(path, owners, unknown)
+    print(f"Ownerzy odświeżeni z API ({reason}): {len(owners)}")
+    if new_unknown:
+        print(f"  Uwaga: {len(new_unknown)} ownerów z deali nie istnieje w HubSpot - będą jako 'Nieznany'")
+    return owners
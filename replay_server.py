@@ -0,0 +1,299 @@
+"""
+Lokalny serwer zastępczy HubSpot API do testów offline i benchmarków.
+
+Dwa tryby:
+  --fixtures DIR   odtwarza odpowiedzi nagrane przez HubSpotClient (HUBSPOT_RECORD_DIR),
+  --synthetic N    generuje syntetyczny pipeline SDR z N dealami.
+
+Użycie:
+  python replay_server.py --synthetic 50000 --port 8765
+  HUBSPOT_BASE_URL=http://127.0.0.1:8765 HUBSPOT_API_TOKEN=x python generate_data.py
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_data import SDR_PIPELINE_ID, STAGES, DATE_ENTERED_FIELDS, EXCLUDE_OWNERS
+from hubspot_client import SEARCH_RESULT_LIMIT, fixture_key
+
+STAGE_IDS = {name: stage_id for stage_id, name in STAGES.items()}
+ENTERED_FIELD_BY_STAGE = {name: field for field, name in DATE_ENTERED_FIELDS.items()}
+STAGE_FLOW = list(DATE_ENTERED_FIELDS.values())
+
+FIRST_NAMES = ["Anna", "Kamil", "Marta", "Piotr", "Ewa", "Tomasz", "Karolina", "Michał", "Julia", "Paweł"]
+LAST_NAMES = ["Nowak", "Oleksiak", "Wiśniewska", "Kowalski", "Zając", "Lewandowski", "Mazur", "Wójcik"]
+LOST_REASONS = ["Was Only Checking", "No Budget", "Not Interested", "Bad Timing", "No Contact", None]
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def iso_ms(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{ms % 1000:03d}Z"
+
+
+class SyntheticPipeline:
+    """Deterministyczny syntetyczny pipeline SDR.
+
+    Deale trzymane są w zwartej postaci (krotki z timestampami w ms),
+    a pełny JSON w formacie HubSpot budowany jest dopiero przy odpowiedzi.
+    Rozkład etapów jest zbliżony do produkcyjnego: ~26% leadów dochodzi do
+    MQL, ~58% MQL do SQL, większość pozostałych kończy jako Lost Before MQL.
+    """
+
+    def __init__(self, size, seed=0, start="2025-01-01", days=365, owner_count=8):
+        rnd = random.Random(seed)
+        self.owners = {}
+        for i in range(owner_count):
+            self.owners[str(70000 + i)] = (FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[(i * 3) % len(LAST_NAMES)])
+        first, last = EXCLUDE_OWNERS[0].split(" ", 1)
+        self.owners[str(70000 + owner_count)] = (first, last)
+        owner_ids = list(self.owners)
+
+        start_ms = int(datetime.fromisoformat(start).replace(tzinfo=timezone.utc).timestamp() * 1000)
+        self.records = []
+        next_id = 10_000_000_000
+        for _ in range(size):
+            next_id += rnd.randint(1, 40)
+            self.records.append(self._simulate(rnd, next_id, rnd.choice(owner_ids), start_ms + rnd.randrange(days * DAY_MS)))
+        self.ids = [r[0] for r in self.records]
+
+    @staticmethod
+    def _simulate(rnd, deal_id, owner_id, t):
+        entered = {"New Lead": t}
+
+        def step(stage, mean_hours):
+            nonlocal t
+            t += int(rnd.expovariate(1 / mean_hours) * HOUR_MS) + 60 * 1000
+            entered[stage] = t
+
+        if rnd.random() < 0.85:
+            step("In Progress", 2)
+        if rnd.random() < 0.45:
+            step("SDR Call Scheduled", 24)
+        if "SDR Call Scheduled" in entered and rnd.random() < 0.6:
+            step("MQL", 48)
+            if rnd.random() < 0.58:
+                step("Kwalka (SQL)", 72)
+                roll = rnd.random()
+                if roll < 0.2:
+                    step("Sales Won", 240)
+                elif roll < 0.55:
+                    step("Sales Lost", 240)
+        elif rnd.random() < 0.7:
+            step("Lost Before MQL", 48)
+
+        last_stage = max(entered, key=entered.get)
+        reason = rnd.choice(LOST_REASONS) if last_stage in ("Sales Lost", "Lost Before MQL") else None
+        description = "Syntetyczny opis powodu" if reason and rnd.random() < 0.4 else None
+        times = tuple(entered.get(stage, 0) for stage in STAGE_FLOW)
+        return (deal_id, owner_id, STAGE_IDS[last_stage], t + rnd.randint(0, DAY_MS), times, reason, description)
+
+    def owners_results(self):
+        return [{"id": oid, "firstName": f, "lastName": l} for oid, (f, l) in self.owners.items()]
+
+    def deal(self, record, properties=None):
+        """Buduje deal w formacie HubSpot (opcjonalnie tylko wybrane properties)."""
+        deal_id, owner_id, stage_id, modified, times, reason, description = record
+        props = {
+            "hs_object_id": str(deal_id),
+            "dealname": f"SDR - deal{deal_id} [PL] - {iso_ms(times[0])[:10]}",
+            "dealstage": stage_id,
+            "pipeline": SDR_PIPELINE_ID,
+            "hubspot_owner_id": owner_id,
+            "createdate": iso_ms(times[0]),
+            "hs_lastmodifieddate": iso_ms(modified),
+            "lost_reason": reason,
+            "lost_description": description,
+        }
+        for stage, ms in zip(STAGE_FLOW, times):
+            if ms:
+                props[ENTERED_FIELD_BY_STAGE[stage]] = iso_ms(ms)
+        if properties is not None:
+            props = {k: props.get(k) for k in properties}
+        return {"id": str(deal_id), "properties": props, "archived": False}
+
+    def deals(self, properties=None):
+        for record in self.records:
+            yield self.deal(record, properties)
+
+    def find(self, deal_id):
+        i = bisect_left(self.ids, int(deal_id))
+        return self.records[i] if i < len(self.ids) and self.ids[i] == int(deal_id) else None
+
+    def search(self, payload):
+        """Rekordy pasujące do filtrów search (AND w grupie, OR między grupami), posortowane."""
+        groups = payload.get("filterGroups") or [{"filters": []}]
+        matched = {}
+        for group in groups:
+            lo, hi = 0, len(self.records)
+            checks = []
+            for f in group.get("filters", []):
+                name, op, value = f["propertyName"], f["operator"], f.get("value")
+                if name == "hs_object_id":
+                    if op == "GTE":
+                        lo = max(lo, bisect_left(self.ids, int(value)))
+                    elif op == "GT":
+                        lo = max(lo, bisect_right(self.ids, int(value)))
+                    elif op == "LTE":
+                        hi = min(hi, bisect_right(self.ids, int(value)))
+                    elif op == "LT":
+                        hi = min(hi, bisect_left(self.ids, int(value)))
+                elif name == "pipeline":
+                    if value != SDR_PIPELINE_ID:
+                        hi = lo
+                elif name == "hs_lastmodifieddate":
+                    checks.append((op, parse_ms(value)))
+            for record in self.records[lo:hi]:
+                if all(compare(record[3], op, value) for op, value in checks):
+                    matched[record[0]] = record
+
+        records = sorted(matched.values(), key=lambda r: r[0])
+        for sort in payload.get("sorts", [])[:1]:
+            if sort.get("propertyName") == "hs_lastmodifieddate":
+                records.sort(key=lambda r: r[3])
+            if sort.get("direction") == "DESCENDING":
+                records.reverse()
+        return records
+
+
+def parse_ms(value):
+    if str(value).isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def compare(actual, op, expected):
+    if op == "GTE":
+        return actual >= expected
+    if op == "GT":
+        return actual > expected
+    if op == "LTE":
+        return actual <= expected
+    if op == "LT":
+        return actual < expected
+    return actual == expected
+
+
+def search_cache_key(payload):
+    return json.dumps({k: v for k, v in payload.items() if k not in ("after", "limit", "properties")}, sort_keys=True)
+
+
+def create_synthetic_app(pipeline, rate_limit_every=0):
+    """Aplikacja aiohttp udająca owners, deals/search i deals/batch/read HubSpot nad SyntheticPipeline."""
+    app = web.Application()
+    counter = {"requests": 0}
+    search_cache = {}
+
+    @web.middleware
+    async def rate_limiter(request, handler):
+        counter["requests"] += 1
+        if rate_limit_every and counter["requests"] % rate_limit_every == 0:
+            return web.json_response({"message": "rate limit"}, status=429, headers={"Retry-After": "1"})
+        return await handler(request)
+
+    app.middlewares.append(rate_limiter)
+
+    async def owners(request):
+        results = pipeline.owners_results()
+        after = int(request.query.get("after") or 0)
+        limit = int(request.query.get("limit", 100))
+        data = {"results": results[after:after + limit]}
+        if after + limit < len(results):
+            data["paging"] = {"next": {"after": str(after + limit)}}
+        return web.json_response(data)
+
+    async def search(request):
+        payload = await request.json()
+        key = search_cache_key(payload)
+        if key not in search_cache:
+            if len(search_cache) > 64:
+                search_cache.clear()
+            search_cache[key] = pipeline.search(payload)
+        records = search_cache[key]
+
+        after = int(payload.get("after") or 0)
+        limit = int(payload.get("limit", 10))
+        if after + limit > SEARCH_RESULT_LIMIT:
+            return web.json_response({"status": "error", "message": "search paging limit exceeded"}, status=400)
+        page = records[after:after + limit]
+        data = {"total": len(records), "results": [pipeline.deal(r, payload.get("properties")) for r in page]}
+        if after + limit < len(records):
+            data["paging"] = {"next": {"after": str(after + limit)}}
+        return web.json_response(data)
+
+    async def batch_read(request):
+        payload = await request.json()
+        records = [pipeline.find(i["id"]) for i in payload.get("inputs", [])]
+        results = [pipeline.deal(r, payload.get("properties")) for r in records if r is not None]
+        status = 200 if len(results) == len(records) else 207
+        return web.json_response({"status": "COMPLETE", "results": results}, status=status)
+
+    app.router.add_get("/crm/v3/owners", owners)
+    app.router.add_post("/crm/v3/objects/deals/batch/read", batch_read)
+    app.router.add_post("/crm/v3/objects/deals/search", search)
+    return app
+
+
+def load_fixtures(fixtures_dir):
+    fixtures = {}
+    for name in os.listdir(fixtures_dir):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(fixtures_dir, name), "r", encoding="utf-8") as f:
+            fixture = json.load(f)
+        fixtures[fixture_key(fixture["method"], fixture["path"], fixture["body"])] = fixture["response"]
+    return fixtures
+
+
+def create_replay_app(fixtures):
+    """Aplikacja aiohttp odtwarzająca nagrane odpowiedzi (dopasowanie po fixture_key)."""
+    app = web.Application()
+
+    async def replay(request):
+        body = await request.json() if request.can_read_body else None
+        key = fixture_key(request.method, request.path_qs, body)
+        if key not in fixtures:
+            return web.json_response({"message": f"brak fixture'a dla {request.method} {request.path_qs}"}, status=404)
+        return web.json_response(fixtures[key])
+
+    app.router.add_route("*", "/{tail:.*}", replay)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny serwer zastępczy HubSpot API")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--fixtures", help="katalog z nagranymi odpowiedziami (HUBSPOT_RECORD_DIR)")
+    mode.add_argument("--synthetic", type=int, metavar="N", help="liczba deali w syntetycznym pipeline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2025-01-01", help="data pierwszego leada (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=365, help="zakres dni, w których powstają leady")
+    parser.add_argument("--owners", type=int, default=8)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="co N-te zapytanie zwraca 429")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+        print(f"Załadowano {len(fixtures)} fixture'ów z {args.fixtures}")
+        app = create_replay_app(fixtures)
+    else:
+        pipeline = SyntheticPipeline(args.synthetic, seed=args.seed, start=args.start,
+                                     days=args.days, owner_count=args.owners)
+        print(f"Wygenerowano syntetyczny pipeline: {len(pipeline.records)} deali, {len(pipeline.owners)} ownerów")
+        app = create_synthetic_app(pipeline, rate_limit_every=args.rate_limit_every)
+
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
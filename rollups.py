@@ -0,0 +1,131 @@
+"""
+Tygodniowe i miesięczne zestawienia dni (data/week/YYYY-Www.json, data/month/YYYY-MM.json).
+
+Zestawienie ma ten sam format co aggregateData() w dashboard.js, więc widok
+tygodnia / miesiąca pobiera jeden plik zamiast każdego dnia z zakresu.
+Liczniki dni są sumowane, listy deali łączone, a konwersje brane z ostatniego dnia.
+Jak pliki dni, zestawienie ma osobny plik szczegółów (data/details/week/..., data/details/month/...).
+"""
+import os
+import re
+from datetime import date, timedelta
+
+from output_writer import load_payload, dumps_payload, write_payload
+from deal_index import build_deal_index
+
+DAY_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.json$")
+STAT_KEYS = ["total", "new_lead", "mql", "sql", "won", "lost_before_mql", "sales_lost", "lost_total"]
+
+
+def week_key(date_str):
+    year, week, _ = date.fromisoformat(date_str).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_key(date_str):
+    return date_str[:7]
+
+
+def week_range(key):
+    monday = date.fromisocalendar(int(key[:4]), int(key[6:]), 1)
+    return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+
+
+def month_range(key):
+    first = date.fromisoformat(key + "-01")
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def aggregate_payloads(payloads):
+    """Łączy payloady dni (posortowane po dacie) tak jak aggregateData() w dashboard.js."""
+    if not payloads:
+        return None
+    if len(payloads) == 1:
+        return dict(payloads[0])
+
+    summary = dict.fromkeys(STAT_KEYS, 0)
+    sdr_map = {}
+    reason_map = {}
+
+    latest = payloads[-1]
+    for data in payloads:
+        for key in STAT_KEYS:
+            summary[key] += data["summary"][key]
+
+        for sdr in data["sdr_data"]:
+            m = sdr_map.get(sdr["name"])
+            if m is None:
+                m = sdr_map[sdr["name"]] = {
+                    "name": sdr["name"],
+                    "stats": dict.fromkeys(STAT_KEYS, 0),
+                    "conversions": None,
+                    "conversion_windows": None,
+                    "deals": [],
+                    "lost_deals": [],
+                }
+            for key in STAT_KEYS:
+                m["stats"][key] += sdr["stats"][key]
+            m["deals"].extend(sdr["deals"])
+            m["lost_deals"].extend(sdr["lost_deals"])
+
+        for lr in data["lost_reasons"]:
+            reason_map[lr["reason"]] = reason_map.get(lr["reason"], 0) + lr["count"]
+
+    # Konwersje per SDR z ostatniego dnia (narastające)
+    for sdr in latest["sdr_data"]:
+        m = sdr_map.get(sdr["name"])
+        if m is not None:
+            if sdr.get("conversions"):
+                m["conversions"] = sdr["conversions"]
+            if sdr.get("conversion_windows"):
+                m["conversion_windows"] = sdr["conversion_windows"]
+
+    sdr_data = sorted(sdr_map.values(), key=lambda s: -s["stats"]["total"])
+    return {
+        "date": None,
+        "generated_at": latest["generated_at"],
+        "summary": summary,
+        "conversions": latest.get("conversions"),
+        "conversion_windows": latest.get("conversion_windows"),
+        "active_sdrs": len(sdr_map),
+        "sdr_data": sdr_data,
+        "lost_reasons": [
+            {"reason": r, "count": c} for r, c in sorted(reason_map.items(), key=lambda x: -x[1])
+        ],
+        "deal_index": build_deal_index(sdr_data),
+    }
+
+
+def day_files(data_dir):
+    """Daty dni zapisanych w data_dir (posortowane)."""
+    return sorted(m.group(1) for m in map(DAY_FILE.match, os.listdir(data_dir)) if m)
+
+
+def write_rollups(data_dir, dates):
+    """Przelicza zestawienia tygodni i miesięcy, do których należą podane dni.
+
+    Dni z zakresu czytane są z plików data_dir/YYYY-MM-DD.json.
+    Zwraca listę zapisanych plików.
+    """
+    periods = {("week", week_key(d)) for d in dates} | {("month", month_key(d)) for d in dates}
+    available = day_files(data_dir)
+    written = []
+
+    for kind, key in sorted(periods):
+        start, end = week_range(key) if kind == "week" else month_range(key)
+        payloads = [load_payload(data_dir, d) for d in available if start <= d <= end]
+        if not payloads:
+            continue
+
+        rollup = aggregate_payloads(payloads)
+        rollup["period"] = key
+        rollup["dates"] = [p["date"] for p in payloads]
+
+        name = f"{kind}/{key}"
+        os.makedirs(os.path.join(data_dir, kind), exist_ok=True)
+        write_payload(data_dir, name, dumps_payload(rollup, name))
+        written.append(os.path.join(data_dir, f"{name}.json"))
+
+    print(f"Zestawienia zaktualizowane: {len(written)} plików")
+    return written